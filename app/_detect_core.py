@@ -0,0 +1,68 @@
+import numpy as np
+from numba import njit
+
+# Numeric core of batch event detection, compiled with Numba. Works on plain
+# arrays only: float64 speeds/accelerations and int64 unix-ns timestamps.
+
+@njit(cache=True, fastmath=True)
+def acceleration_kph_s(prev_speed_kph, prev_ts_ns, speed_kph, ts_ns):
+    """Acceleration in km/h per second; zero for non-positive time deltas."""
+    delta_s = (ts_ns - prev_ts_ns) / 1e9
+    if delta_s <= 0.0:
+        return 0.0
+    return (speed_kph - prev_speed_kph) / delta_s
+
+@njit(cache=True, fastmath=True)
+def accelerations(speeds, ts_ns, prev_speed_kph, prev_ts_ns, has_prev):
+    """Per-point accelerations relative to the preceding point."""
+    n = speeds.shape[0]
+    out = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return out
+    if has_prev:
+        out[0] = acceleration_kph_s(prev_speed_kph, prev_ts_ns, speeds[0], ts_ns[0])
+    for i in range(1, n):
+        out[i] = acceleration_kph_s(speeds[i - 1], ts_ns[i - 1], speeds[i], ts_ns[i])
+    return out
+
+@njit(cache=True, fastmath=True)
+def detect_core(speeds, ts_ns, accels, os_th, hb_th, sa_th, idle_th_s,
+                idle_start_ns, has_idle_start):
+    """Evaluate all detection rules over a batch of points.
+    
+    Returns int8 masks for overspeeding, harsh braking, sudden acceleration
+    and idling, the idle duration (seconds) at idling points, and where idle
+    tracking stands after the batch: whether a start is set and the index of
+    the point it started at (-1 for the start carried in via idle_start_ns).
+    """
+    n = speeds.shape[0]
+    overspeed = np.zeros(n, dtype=np.int8)
+    harsh = np.zeros(n, dtype=np.int8)
+    sudden = np.zeros(n, dtype=np.int8)
+    idle = np.zeros(n, dtype=np.int8)
+    idle_duration = np.zeros(n, dtype=np.float64)
+    idle_start_idx = -1
+    
+    for i in range(n):
+        if speeds[i] > os_th:
+            overspeed[i] = 1
+        if accels[i] < hb_th:
+            harsh[i] = 1
+        if accels[i] > sa_th:
+            sudden[i] = 1
+        
+        if speeds[i] == 0.0:
+            if not has_idle_start:
+                idle_start_ns = ts_ns[i]
+                idle_start_idx = i
+                has_idle_start = True
+            else:
+                idle_s = (ts_ns[i] - idle_start_ns) / 1e9
+                if idle_s >= idle_th_s:
+                    idle[i] = 1
+                    idle_duration[i] = idle_s
+                    has_idle_start = False
+        else:
+            has_idle_start = False
+    
+    return overspeed, harsh, sudden, idle, idle_duration, has_idle_start, idle_start_idx
@@ -1,131 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
-from ..db import get_db
-from ..models import Driver, DriverScore, Event, Trip
-from ..persistence import get_driver_events, get_driver_trips, get_driver_scores, get_event_stats
-from sqlalchemy import func
-from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, aliased
+from typing import Iterator, Optional
+from ..cache import DRIVERS_CACHE_KEY, get_cached, set_cached
+from ..db import SessionLocal, get_db
+from ..models import DriverScore, Event, Trip
+from ..persistence import get_event_stats
+from ..utils.orjson_response import ORJSONResponse, iter_json_array
+from sqlalchemy import func, select
+from datetime import date, timedelta
+from itertools import chain
 
 router = APIRouter()
 
+# Columns selected by the listing endpoints; rows come back as mappings
+# that are serialized as-is, without building per-row dicts
+EVENT_COLUMNS = (
+    Event.id, Event.driver_id, Event.trip_id, Event.event_type, Event.timestamp,
+    Event.lat, Event.lon, Event.speed_kph, Event.acceleration_kph_s, Event.meta,
+    Event.created_at
+)
+TRIP_COLUMNS = (
+    Trip.id, Trip.track_id, Trip.driver_id, Trip.start_time, Trip.end_time,
+    Trip.created_at
+)
+SCORE_COLUMNS = (
+    DriverScore.id, DriverScore.driver_id, DriverScore.date, DriverScore.avg_speed,
+    DriverScore.overspeed_count, DriverScore.harsh_brake_count, DriverScore.idle_count,
+    DriverScore.risk_score, DriverScore.created_at
+)
+
+# Rows fetched and serialized per chunk when streaming large listings
+STREAM_CHUNK_ROWS = 200
+
+def _stream_rows(stmt) -> Iterator[bytes]:
+    """Stream the rows of a select as a JSON array, one chunk at a time.
+    
+    Runs after the endpoint has returned, so it uses its own session rather
+    than the request-scoped one from get_db.
+    """
+    with SessionLocal() as db:
+        result = db.execute(stmt.execution_options(yield_per=STREAM_CHUNK_ROWS)).mappings()
+        yield from iter_json_array(result.partitions())
+
 @router.get("/drivers")
-def list_drivers(db: Session = Depends(get_db)) -> List[Dict[str, Any]]:
+def list_drivers(request: Request, db: Session = Depends(get_db)) -> ORJSONResponse:
     """Get list of all drivers with their current scores."""
+    # Dashboard polls are served from the short-lived response cache
+    cached = get_cached(DRIVERS_CACHE_KEY)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
+    
     try:
-        # Get only the first 3 drivers (tracks 1, 2, 3)
-        drivers = db.query(Driver).filter(Driver.external_id.in_([
-            "driver_1", "driver_2", "driver_3"
-        ])).all()
-        
-        # If drivers don't exist, create them
-        if len(drivers) < 3:
-            existing_ids = [d.external_id for d in drivers]
-            for i in range(1, 4):
-                driver_id = f"driver_{i}"
-                if driver_id not in existing_ids:
-                    driver = Driver(
-                        external_id=driver_id,
-                        name=f"Driver {i}"
-                    )
-                    db.add(driver)
-            db.commit()
-            drivers = db.query(Driver).filter(Driver.external_id.in_([
-                "driver_1", "driver_2", "driver_3"
-            ])).all()
-        
-        # Get latest scores for each driver
-        latest_scores = db.query(
-            DriverScore.driver_id,
-            func.max(DriverScore.created_at).label('latest_score_date')
-        ).group_by(DriverScore.driver_id).subquery()
-        
-        scores = db.query(DriverScore).join(
-            latest_scores,
-            (DriverScore.driver_id == latest_scores.c.driver_id) &
-            (DriverScore.created_at == latest_scores.c.latest_score_date)
-        ).all()
-        
-        # Create a map of driver_id to score
-        score_map = {score.driver_id: score for score in scores}
+        # The dashboard drivers (tracks 1, 2, 3) are seeded and cached at startup
+        drivers = request.app.state.default_drivers
+        
+        # Latest score per driver in a single pass over driver_scores: number
+        # each driver's rows newest first and keep only the first one
+        ranked_scores = select(
+            DriverScore,
+            func.row_number().over(
+                partition_by=DriverScore.driver_id,
+                order_by=(DriverScore.created_at.desc(), DriverScore.id.desc())
+            ).label("rank")
+        ).where(
+            DriverScore.driver_id.in_([driver["id"] for driver in drivers])
+        ).subquery()
+        latest_score = aliased(DriverScore, ranked_scores)
+        
+        scores = db.execute(
+            select(latest_score).where(ranked_scores.c.rank == 1)
+        ).scalars().all()
+        scores_by_driver = {score.driver_id: score for score in scores}
         
         # Build response
         result = []
         for driver in drivers:
-            driver_data = {
-                "id": driver.id,
-                "external_id": driver.external_id,
-                "name": driver.name,
-                "created_at": driver.created_at.isoformat() if driver.created_at else None,
-                "current_score": None
-            }
+            driver_data = dict(driver, current_score=None)
             
             # Add score if available
-            if driver.id in score_map:
-                score = score_map[driver.id]
+            score = scores_by_driver.get(driver["id"])
+            if score is not None:
                 driver_data["current_score"] = {
                     "risk_score": score.risk_score,
                     "avg_speed": score.avg_speed,
                     "overspeed_count": score.overspeed_count,
                     "harsh_brake_count": score.harsh_brake_count,
                     "idle_count": score.idle_count,
-                    "date": score.date.isoformat() if score.date else None
+                    "date": score.date
                 }
             
             result.append(driver_data)
         
-        return result
+        response = ORJSONResponse(result)
+        set_cached(DRIVERS_CACHE_KEY, response.body)
+        return response
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @router.get("/events")
 def list_events(
-    db: Session = Depends(get_db),
     driver_id: Optional[int] = Query(None, description="Filter by driver ID"),
     limit: int = Query(100, ge=1, le=1000, description="Number of events to return"),
     offset: int = Query(0, ge=0, description="Number of events to skip")
-) -> List[Dict[str, Any]]:
+) -> StreamingResponse:
     """Get list of events with optional filtering."""
+    stmt = select(*EVENT_COLUMNS)
+    
+    if driver_id:
+        stmt = stmt.where(Event.driver_id == driver_id)
+    
+    stmt = stmt.order_by(Event.timestamp.desc()).offset(offset).limit(limit)
+    
+    # Stream the page so large limits are sent as they are serialized; the
+    # first step runs the query, so database errors still surface as a 500
+    chunks = _stream_rows(stmt)
     try:
-        query = db.query(Event)
-        
-        if driver_id:
-            query = query.filter(Event.driver_id == driver_id)
-        
-        events = query.order_by(Event.timestamp.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for event in events:
-            event_data = {
-                "id": event.id,
-                "driver_id": event.driver_id,
-                "trip_id": event.trip_id,
-                "event_type": event.event_type,
-                "timestamp": event.timestamp.isoformat() if event.timestamp else None,
-                "lat": event.lat,
-                "lon": event.lon,
-                "speed_kph": event.speed_kph,
-                "acceleration_kph_s": event.acceleration_kph_s,
-                "meta": event.meta,
-                "created_at": event.created_at.isoformat() if event.created_at else None
-            }
-            result.append(event_data)
-        
-        return result
-        
+        head = next(chunks)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    return StreamingResponse(chain([head], chunks), media_type="application/json")
 
 @router.get("/events/stats")
 def get_events_stats(
     db: Session = Depends(get_db),
     driver_id: Optional[int] = Query(None, description="Filter by driver ID")
-) -> Dict[str, Any]:
+) -> ORJSONResponse:
     """Get event statistics."""
     try:
         stats = get_event_stats(db, driver_id)
-        return stats
+        return ORJSONResponse(stats)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -136,29 +142,16 @@ def get_driver_events_endpoint(
     db: Session = Depends(get_db),
     limit: int = Query(100, ge=1, le=1000, description="Number of events to return"),
     offset: int = Query(0, ge=0, description="Number of events to skip")
-) -> List[Dict[str, Any]]:
+) -> ORJSONResponse:
     """Get events for a specific driver."""
     try:
-        events = get_driver_events(db, driver_id, limit, offset)
+        stmt = select(*EVENT_COLUMNS).where(
+            Event.driver_id == driver_id
+        ).order_by(
+            Event.timestamp.desc()
+        ).offset(offset).limit(limit)
         
-        result = []
-        for event in events:
-            event_data = {
-                "id": event.id,
-                "driver_id": event.driver_id,
-                "trip_id": event.trip_id,
-                "event_type": event.event_type,
-                "timestamp": event.timestamp.isoformat() if event.timestamp else None,
-                "lat": event.lat,
-                "lon": event.lon,
-                "speed_kph": event.speed_kph,
-                "acceleration_kph_s": event.acceleration_kph_s,
-                "meta": event.meta,
-                "created_at": event.created_at.isoformat() if event.created_at else None
-            }
-            result.append(event_data)
-        
-        return result
+        return ORJSONResponse(db.execute(stmt).mappings().all())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -169,24 +162,16 @@ def get_driver_trips_endpoint(
     db: Session = Depends(get_db),
     limit: int = Query(50, ge=1, le=500, description="Number of trips to return"),
     offset: int = Query(0, ge=0, description="Number of trips to skip")
-) -> List[Dict[str, Any]]:
+) -> ORJSONResponse:
     """Get trips for a specific driver."""
     try:
-        trips = get_driver_trips(db, driver_id, limit, offset)
-        
-        result = []
-        for trip in trips:
-            trip_data = {
-                "id": trip.id,
-                "track_id": trip.track_id,
-                "driver_id": trip.driver_id,
-                "start_time": trip.start_time.isoformat() if trip.start_time else None,
-                "end_time": trip.end_time.isoformat() if trip.end_time else None,
-                "created_at": trip.created_at.isoformat() if trip.created_at else None
-            }
-            result.append(trip_data)
+        stmt = select(*TRIP_COLUMNS).where(
+            Trip.driver_id == driver_id
+        ).order_by(
+            Trip.start_time.desc()
+        ).offset(offset).limit(limit)
         
-        return result
+        return ORJSONResponse(db.execute(stmt).mappings().all())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -196,27 +181,17 @@ def get_driver_scores_endpoint(
     driver_id: int,
     db: Session = Depends(get_db),
     days: int = Query(30, ge=1, le=365, description="Number of days to look back")
-) -> List[Dict[str, Any]]:
+) -> ORJSONResponse:
     """Get scores for a specific driver."""
     try:
-        scores = get_driver_scores(db, driver_id, days)
+        start_date = date.today() - timedelta(days=days)
         
-        result = []
-        for score in scores:
-            score_data = {
-                "id": score.id,
-                "driver_id": score.driver_id,
-                "date": score.date.isoformat() if score.date else None,
-                "avg_speed": score.avg_speed,
-                "overspeed_count": score.overspeed_count,
-                "harsh_brake_count": score.harsh_brake_count,
-                "idle_count": score.idle_count,
-                "risk_score": score.risk_score,
-                "created_at": score.created_at.isoformat() if score.created_at else None
-            }
-            result.append(score_data)
+        stmt = select(*SCORE_COLUMNS).where(
+            DriverScore.driver_id == driver_id,
+            DriverScore.date >= start_date
+        ).order_by(DriverScore.date.desc())
         
-        return result
+        return ORJSONResponse(db.execute(stmt).mappings().all())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
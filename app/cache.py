@@ -0,0 +1,27 @@
+import threading
+from typing import Optional
+from cachetools import TTLCache
+from .config import API_CACHE_TTL_SECONDS
+
+# Cache key for the serialized /api/drivers response
+DRIVERS_CACHE_KEY = "drivers:latest"
+
+# Short-lived cache of serialized API responses, shared by the threadpool
+# endpoints and the detection pipeline (which invalidates on score updates)
+_cache = TTLCache(maxsize=64, ttl=API_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+
+def get_cached(key: str) -> Optional[bytes]:
+    """Get a cached response body, or None if missing or expired."""
+    with _lock:
+        return _cache.get(key)
+
+def set_cached(key: str, body: bytes):
+    """Cache a response body for the configured TTL."""
+    with _lock:
+        _cache[key] = body
+
+def invalidate(key: str):
+    """Drop a cached response body."""
+    with _lock:
+        _cache.pop(key, None)
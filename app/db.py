@@ -1,14 +1,88 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from .models import Base
-from .config import DATABASE_URL
+from typing import Dict, List, Optional
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import Session, sessionmaker
+from .models import Base, Driver
+from .config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE_SECONDS,
+    DB_POOL_PRE_PING
+)
 
-engine = create_engine(DATABASE_URL, future=True)
+# Pooled engine: LIFO checkout keeps a small set of warm connections in use,
+# pre-ping drops connections the server has closed
+engine_options = dict(
+    future=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    pool_use_lifo=True,
+    # Rows per multi-VALUES statement for batched INSERTs
+    insertmanyvalues_page_size=1000
+)
+db_url = make_url(DATABASE_URL)
+if db_url.get_backend_name() == "sqlite" and db_url.database in (None, "", ":memory:"):
+    # An in-memory database lives in a single connection; share it across
+    # threads (TestClient, persistence workers) instead of pooling
+    for option in ("pool_size", "max_overflow", "pool_recycle", "pool_use_lifo"):
+        engine_options.pop(option)
+    engine_options.update(poolclass=StaticPool, connect_args={"check_same_thread": False})
+elif db_url.get_backend_name() == "postgresql" and db_url.get_driver_name() == "psycopg2":
+    # Also batch executemany UPDATE/DELETE statements with execute_batch
+    engine_options["executemany_mode"] = "values_plus_batch"
+engine = create_engine(db_url, **engine_options)
 SessionLocal = sessionmaker(bind=engine)
 
-def init_db():
-    """Initialize the database by creating all tables."""
+# Drivers shown on the dashboard (tracks 1, 2, 3)
+DEFAULT_DRIVER_IDS = ["driver_1", "driver_2", "driver_3"]
+
+# Memoized external_id -> primary key of drivers seen so far
+driver_map: Dict[str, int] = {}
+
+def seed_default_drivers() -> List[Dict]:
+    """Ensure the dashboard drivers exist and return them as dicts, by id."""
+    with SessionLocal() as db:
+        query = db.query(Driver).filter(
+            Driver.external_id.in_(DEFAULT_DRIVER_IDS)
+        ).order_by(Driver.id)
+        drivers = query.all()
+        
+        # If drivers don't exist, create them
+        if len(drivers) < len(DEFAULT_DRIVER_IDS):
+            existing_ids = {driver.external_id for driver in drivers}
+            for i, driver_id in enumerate(DEFAULT_DRIVER_IDS, start=1):
+                if driver_id not in existing_ids:
+                    db.add(Driver(external_id=driver_id, name=f"Driver {i}"))
+            db.commit()
+            drivers = query.all()
+        
+        driver_map.update({driver.external_id: driver.id for driver in drivers})
+        return [
+            {
+                "id": driver.id,
+                "external_id": driver.external_id,
+                "name": driver.name,
+                "created_at": driver.created_at
+            }
+            for driver in drivers
+        ]
+
+def resolve_driver_id(db: Session, external_id: str) -> Optional[int]:
+    """Primary key of a driver by external id, memoized in driver_map."""
+    driver_pk = driver_map.get(external_id)
+    if driver_pk is None:
+        driver_pk = db.query(Driver.id).filter(Driver.external_id == external_id).scalar()
+        if driver_pk is not None:
+            driver_map[external_id] = driver_pk
+    return driver_pk
+
+def init_db() -> List[Dict]:
+    """Initialize the database by creating all tables and seeding the dashboard drivers."""
     Base.metadata.create_all(bind=engine)
+    return seed_default_drivers()
 
 def get_db():
     """Dependency to get database session."""
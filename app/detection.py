@@ -1,23 +1,149 @@
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Tuple, List
-from .config import (
-    OVERSPEED_KPH, 
-    HARSH_BRAKE_KPH_S, 
-    SUDDEN_ACCEL_KPH_S, 
-    IDLE_SECONDS_THRESHOLD
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple, List, NamedTuple, Union
+import numpy as np
+import orjson
+from cachetools import LRUCache
+from sqlalchemy.exc import DataError, IntegrityError
+from .config import config, DRIVER_STATE_MAX_DRIVERS, EVENT_BUFFER_MAX_ROWS
+from . import _detect_core
+from .utils.orjson_response import orjson_default
+from .utils.striped_map import StripedMap
+
+logger = logging.getLogger(__name__)
+
+_STATE_LOCK_STRIPES = 64
+
+# In-memory state for each driver, sharded with a lock per shard so threads
+# don't contend on one map; each shard is bounded with least-recently-used
+# eviction. The bound is per shard, DRIVER_STATE_MAX_DRIVERS // 64 drivers
+# (at least one), so a busy shard can evict before the total is reached,
+# and values below 64 still keep one driver per shard
+driver_states = StripedMap(
+    _STATE_LOCK_STRIPES,
+    lambda: LRUCache(maxsize=max(1, DRIVER_STATE_MAX_DRIVERS // _STATE_LOCK_STRIPES))
 )
 
-# In-memory state for each driver
-driver_states: Dict[str, Dict] = {}
+_EPOCH = datetime(1970, 1, 1)
+
+# Striped locks guarding per-driver state across awaits in handle_point,
+# one per state shard
+_state_locks = [asyncio.Lock() for _ in range(_STATE_LOCK_STRIPES)]
+
+def _state_lock(driver_id: str) -> asyncio.Lock:
+    """Get the lock stripe for a driver."""
+    return _state_locks[driver_states.shard_index(driver_id)]
+
+# Event rows awaiting one batched INSERT; filled from persistence worker threads.
+# Bounded so a database outage can't grow it without limit; the oldest rows
+# are dropped first. Flushes are serialized by their own lock, so appends
+# never wait on an INSERT
+_pending_events: deque = deque(maxlen=EVENT_BUFFER_MAX_ROWS)
+_pending_events_lock = threading.Lock()
+_events_flush_lock = threading.Lock()
+_last_events_flush = time.monotonic()
+
+# Latest score counters per (driver pk, day) not yet written; the score
+# flusher upserts them periodically, so a burst of updates is one write
+_dirty_scores: Dict[Tuple[int, date], Dict] = {}
+_dirty_scores_lock = threading.Lock()
+_scores_flush_lock = threading.Lock()
+
+class EventRec(NamedTuple):
+    """A detected driving event."""
+    event_type: str
+    timestamp: datetime
+    lat: float
+    lon: float
+    speed_kph: float
+    acceleration_kph_s: float
+    meta: Dict
+
+    def to_payload(self) -> Dict:
+        """Dict shape of the event for WebSocket broadcast.
+        
+        The timestamp stays a datetime; orjson renders it in ISO format.
+        """
+        return self._asdict()
+
+@dataclass(slots=True)
+class Telemetry:
+    """A GPS point fed to handle_point, also broadcast as telemetry."""
+    driver_id: str
+    track_id: str
+    timestamp: datetime
+    lat: float
+    lon: float
+    speed_kph: float = 0.0
+    
+    @classmethod
+    def from_dict(cls, payload: Dict) -> "Telemetry":
+        """Build a point from a dict payload, parsing an ISO 8601 timestamp."""
+        timestamp = payload['timestamp']
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        return cls(
+            driver_id=payload['driver_id'],
+            track_id=payload.get('track_id', 'unknown'),
+            timestamp=timestamp,
+            lat=payload['lat'],
+            lon=payload['lon'],
+            speed_kph=payload.get('speed_kph', 0.0)
+        )
+
+@dataclass(slots=True)
+class ScoreUpdate:
+    """Current counters and risk score of a driver, as broadcast."""
+    driver_id: str
+    risk_score: int
+    overspeed_count: int
+    harsh_brake_count: int
+    sudden_accel_count: int
+    idle_count: int
+
+@dataclass(slots=True)
+class Message:
+    """WebSocket message envelope; orjson encodes it as {"type", "payload"}."""
+    type: str
+    payload: Any
 
 def compute_acceleration(prev_speed_kph: float, prev_ts: datetime, speed_kph: float, ts: datetime) -> float:
-    """Compute acceleration in km/h per second (kph/s)."""
+    """Compute acceleration in km/h per second (kph/s).
+    
+    Stays plain Python for single points: calling a compiled kernel per
+    point costs more in dispatch and timestamp conversion than the
+    arithmetic. Batches use _detect_core.acceleration_kph_s, which matches it.
+    """
     delta_s = (ts - prev_ts).total_seconds()
     if delta_s <= 0.0:
         # Avoid division by zero; treat as zero acceleration
         return 0.0
     return (speed_kph - prev_speed_kph) / delta_s
 
+def _new_driver_state(speed_kph: float, timestamp: datetime) -> Dict:
+    """Initial state for a driver seen for the first time."""
+    return {
+        'last_speed_kph': speed_kph,
+        'last_timestamp': timestamp,
+        'current_idle_start_ts': None,
+        'overspeed_count': 0,
+        'harsh_brake_count': 0,
+        'sudden_accel_count': 0,
+        'idle_count': 0,
+        'last_non_zero_speed_ts': timestamp if speed_kph > 0 else None
+    }
+
+def _epoch_ns(ts: datetime) -> int:
+    """Nanoseconds since the epoch, treating naive datetimes as UTC (like numpy)."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (ts - _EPOCH) // timedelta(microseconds=1) * 1000
+
 def detect_events(
     driver_id: str,
     timestamp: datetime,
@@ -25,62 +151,44 @@ def detect_events(
     lon: float,
     speed_kph: float,
     acceleration_kph_s: float
-) -> List[Dict]:
+) -> List[EventRec]:
     """Detect driving events based on current telemetry."""
     events = []
     
-    # Initialize driver state if not exists
-    if driver_id not in driver_states:
-        driver_states[driver_id] = {
-            'last_speed_kph': speed_kph,
-            'last_timestamp': timestamp,
-            'current_idle_start_ts': None,
-            'overspeed_count': 0,
-            'harsh_brake_count': 0,
-            'sudden_accel_count': 0,
-            'idle_count': 0,
-            'last_non_zero_speed_ts': timestamp if speed_kph > 0 else None
-        }
+    # Bind thresholds to locals once per call; reading them from the config
+    # object keeps runtime overrides (update_detection_thresholds) effective
+    overspeed_kph = config.overspeed_kph
+    harsh_brake_kph_s = config.harsh_brake_kph_s
+    sudden_accel_kph_s = config.sudden_accel_kph_s
+    idle_seconds_threshold = config.idle_seconds_threshold
     
-    state = driver_states[driver_id]
+    # Initialize driver state if not exists
+    state = driver_states.get(driver_id)
+    if state is None:
+        state = driver_states[driver_id] = _new_driver_state(speed_kph, timestamp)
     
     # Check for overspeeding
-    if speed_kph > OVERSPEED_KPH:
-        events.append({
-            'event_type': 'overspeeding',
-            'timestamp': timestamp.isoformat(),
-            'lat': lat,
-            'lon': lon,
-            'speed_kph': speed_kph,
-            'acceleration_kph_s': acceleration_kph_s,
-            'meta': {'threshold': OVERSPEED_KPH}
-        })
+    if speed_kph > overspeed_kph:
+        events.append(EventRec(
+            'overspeeding', timestamp, lat, lon, speed_kph, acceleration_kph_s,
+            {'threshold': overspeed_kph}
+        ))
         state['overspeed_count'] += 1
     
     # Check for harsh braking
-    if acceleration_kph_s < HARSH_BRAKE_KPH_S:
-        events.append({
-            'event_type': 'harsh_braking',
-            'timestamp': timestamp.isoformat(),
-            'lat': lat,
-            'lon': lon,
-            'speed_kph': speed_kph,
-            'acceleration_kph_s': acceleration_kph_s,
-            'meta': {'threshold': HARSH_BRAKE_KPH_S}
-        })
+    if acceleration_kph_s < harsh_brake_kph_s:
+        events.append(EventRec(
+            'harsh_braking', timestamp, lat, lon, speed_kph, acceleration_kph_s,
+            {'threshold': harsh_brake_kph_s}
+        ))
         state['harsh_brake_count'] += 1
     
     # Check for sudden acceleration
-    if acceleration_kph_s > SUDDEN_ACCEL_KPH_S:
-        events.append({
-            'event_type': 'sudden_acceleration',
-            'timestamp': timestamp.isoformat(),
-            'lat': lat,
-            'lon': lon,
-            'speed_kph': speed_kph,
-            'acceleration_kph_s': acceleration_kph_s,
-            'meta': {'threshold': SUDDEN_ACCEL_KPH_S}
-        })
+    if acceleration_kph_s > sudden_accel_kph_s:
+        events.append(EventRec(
+            'sudden_acceleration', timestamp, lat, lon, speed_kph, acceleration_kph_s,
+            {'threshold': sudden_accel_kph_s}
+        ))
         state['sudden_accel_count'] += 1
     
     # Check for idling
@@ -89,16 +197,11 @@ def detect_events(
             state['current_idle_start_ts'] = timestamp
         else:
             idle_time = (timestamp - state['current_idle_start_ts']).total_seconds()
-            if idle_time >= IDLE_SECONDS_THRESHOLD:
-                events.append({
-                    'event_type': 'idling',
-                    'timestamp': timestamp.isoformat(),
-                    'lat': lat,
-                    'lon': lon,
-                    'speed_kph': speed_kph,
-                    'acceleration_kph_s': acceleration_kph_s,
-                    'meta': {'idle_duration_seconds': idle_time, 'threshold': IDLE_SECONDS_THRESHOLD}
-                })
+            if idle_time >= idle_seconds_threshold:
+                events.append(EventRec(
+                    'idling', timestamp, lat, lon, speed_kph, acceleration_kph_s,
+                    {'idle_duration_seconds': idle_time, 'threshold': idle_seconds_threshold}
+                ))
                 state['idle_count'] += 1
                 state['current_idle_start_ts'] = None  # Reset to avoid duplicate events
     else:
@@ -112,76 +215,197 @@ def detect_events(
     
     return events
 
+def detect_events_batch(
+    driver_id: str,
+    timestamps: np.ndarray,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    speeds: np.ndarray,
+    accels: Optional[np.ndarray] = None
+) -> List[EventRec]:
+    """Detect driving events for a batch of points in one compiled pass.
+    
+    Equivalent to calling detect_events for each point in order, for bulk or
+    replay ingestion. Timestamps are a datetime64 array in ascending order.
+    Accelerations are derived from the speeds (relative to the driver's last
+    point, as in handle_point) when not given.
+    """
+    n = len(speeds)
+    if n == 0:
+        return []
+    
+    overspeed_kph = config.overspeed_kph
+    harsh_brake_kph_s = config.harsh_brake_kph_s
+    sudden_accel_kph_s = config.sudden_accel_kph_s
+    idle_seconds_threshold = config.idle_seconds_threshold
+    
+    # Convert once at the boundary; the compiled core only sees plain arrays
+    times = timestamps.astype('datetime64[us]')
+    ts_list = times.tolist()
+    ts_ns = times.astype('datetime64[ns]').astype(np.int64)
+    speeds = np.ascontiguousarray(speeds, dtype=np.float64)
+    
+    prev_state = driver_states.get(driver_id)
+    if accels is None:
+        if prev_state is not None:
+            accels = _detect_core.accelerations(
+                speeds, ts_ns, float(prev_state['last_speed_kph']),
+                _epoch_ns(prev_state['last_timestamp']), True
+            )
+        else:
+            accels = _detect_core.accelerations(speeds, ts_ns, 0.0, 0, False)
+    else:
+        accels = np.ascontiguousarray(accels, dtype=np.float64)
+    
+    state = prev_state
+    if state is None:
+        state = driver_states[driver_id] = _new_driver_state(float(speeds[0]), ts_list[0])
+    
+    idle_start = state['current_idle_start_ts']
+    overspeed, harsh, sudden, idle, idle_duration, has_idle_start, idle_start_idx = (
+        _detect_core.detect_core(
+            speeds, ts_ns, accels,
+            float(overspeed_kph), float(harsh_brake_kph_s), float(sudden_accel_kph_s),
+            float(idle_seconds_threshold),
+            _epoch_ns(idle_start) if idle_start is not None else 0,
+            idle_start is not None
+        )
+    )
+    
+    # Materialize records only for flagged points, in detect_events order
+    events = []
+    for i in np.flatnonzero(overspeed | harsh | sudden | idle).tolist():
+        point = (ts_list[i], float(lats[i]), float(lons[i]), float(speeds[i]), float(accels[i]))
+        if overspeed[i]:
+            events.append(EventRec('overspeeding', *point, {'threshold': overspeed_kph}))
+        if harsh[i]:
+            events.append(EventRec('harsh_braking', *point, {'threshold': harsh_brake_kph_s}))
+        if sudden[i]:
+            events.append(EventRec('sudden_acceleration', *point, {'threshold': sudden_accel_kph_s}))
+        if idle[i]:
+            events.append(EventRec(
+                'idling', *point,
+                {'idle_duration_seconds': float(idle_duration[i]), 'threshold': idle_seconds_threshold}
+            ))
+    
+    # Update state
+    state['overspeed_count'] += int(overspeed.sum())
+    state['harsh_brake_count'] += int(harsh.sum())
+    state['sudden_accel_count'] += int(sudden.sum())
+    state['idle_count'] += int(idle.sum())
+    if not has_idle_start:
+        state['current_idle_start_ts'] = None
+    elif idle_start_idx >= 0:
+        state['current_idle_start_ts'] = ts_list[idle_start_idx]
+    moving = np.flatnonzero(speeds != 0)
+    if len(moving):
+        state['last_non_zero_speed_ts'] = ts_list[moving[-1]]
+    state['last_speed_kph'] = float(speeds[-1])
+    state['last_timestamp'] = ts_list[-1]
+    
+    return events
+
 def calculate_risk_score(driver_id: str) -> int:
-    """Calculate risk score for a driver."""
-    if driver_id not in driver_states:
-        return 100  # Perfect score for new drivers
+    """Calculate risk score for a driver from its in-memory counters.
     
-    state = driver_states[driver_id]
+    Used for live results; persisted scores are computed by the database
+    with the same configured weights (see upsert_driver_score).
+    """
+    state = driver_states.get(driver_id)
+    if state is None:
+        return config.score_base  # Perfect score for new drivers
     
-    # Scoring formula: max(0, 100 - (overspeed_count*2 + harsh_brake_count*3 + idle_count*1))
+    # Scoring formula: max(0, base - (overspeed_count*ow + harsh_brake_count*hw + idle_count*iw))
     penalty = (
-        state['overspeed_count'] * 2 +
-        state['harsh_brake_count'] * 3 +
-        state['idle_count'] * 1
+        state['overspeed_count'] * config.score_overspeed_weight +
+        state['harsh_brake_count'] * config.score_harsh_brake_weight +
+        state['idle_count'] * config.score_idle_weight
     )
     
-    return max(0, 100 - penalty)
+    return max(0, config.score_base - penalty)
 
-async def handle_point(payload: Dict, manager) -> Dict:
-    """Process a GPS point and return detection results."""
+async def handle_point(payload: Union[Telemetry, Dict], manager,
+                       driver_pk: Optional[int] = None, trip_pk: Optional[int] = None) -> Dict:
+    """Process a GPS point and return detection results.
+    
+    The payload is a Telemetry point (as sent by the simulator) or a dict
+    with the same keys and a datetime or ISO 8601 timestamp. Optional
+    ``driver_pk``/``trip_pk`` carry already resolved primary keys so
+    persistence skips the lookups; they are kept off the point, which is
+    broadcast as-is. With ``persist_without_clients`` off,
+    nothing is persisted while no dashboard is connected; detection state
+    is still updated.
+    """
     try:
-        driver_id = payload['driver_id']
-        timestamp = datetime.fromisoformat(payload['timestamp'].replace('Z', '+00:00'))
-        lat = payload['lat']
-        lon = payload['lon']
-        speed_kph = payload.get('speed_kph', 0.0)
-        track_id = payload.get('track_id', 'unknown')
+        point = payload if isinstance(payload, Telemetry) else Telemetry.from_dict(payload)
+        driver_id = point.driver_id
+        timestamp = point.timestamp
+        lat = point.lat
+        lon = point.lon
+        speed_kph = point.speed_kph
+        track_id = point.track_id
+        has_clients = manager is not None and bool(manager.active_connections)
         
-        # Calculate acceleration if we have previous data
-        acceleration_kph_s = 0.0
-        if driver_id in driver_states:
-            prev_state = driver_states[driver_id]
-            acceleration_kph_s = compute_acceleration(
-                prev_state['last_speed_kph'],
-                prev_state['last_timestamp'],
-                speed_kph,
-                timestamp
-            )
+        # Serialize points of the same driver while its state is read and
+        # updated; other drivers use other stripes. Nothing slow runs under it
+        async with _state_lock(driver_id):
+            # Calculate acceleration if we have previous data
+            acceleration_kph_s = 0.0
+            prev_state = driver_states.get(driver_id)
+            if prev_state is not None:
+                acceleration_kph_s = compute_acceleration(
+                    prev_state['last_speed_kph'],
+                    prev_state['last_timestamp'],
+                    speed_kph,
+                    timestamp
+                )
         
-        # Detect events
-        events = detect_events(driver_id, timestamp, lat, lon, speed_kph, acceleration_kph_s)
+            # Detect events
+            events = detect_events(driver_id, timestamp, lat, lon, speed_kph, acceleration_kph_s)
         
-        # Calculate risk score
-        risk_score = calculate_risk_score(driver_id)
+            # Calculate risk score
+            risk_score = calculate_risk_score(driver_id)
         
-        # Persist events and update scores
-        if events:
-            await _persist_events_and_scores(driver_id, track_id, timestamp, events, risk_score)
+            # Snapshot the state for persistence while it is consistent
+            state = driver_states[driver_id]
+            persist = bool(events) and (has_clients or config.persist_without_clients)
+            snapshot = dict(state) if persist else None
+        
+            # Prepare response
+            result = {
+                'driver_id': driver_id,
+                'timestamp': timestamp,
+                'lat': lat,
+                'lon': lon,
+                'speed_kph': speed_kph,
+                'acceleration_kph_s': acceleration_kph_s,
+                'events': events,
+                'risk_score': risk_score,
+                'overspeed_count': state['overspeed_count'],
+                'harsh_brake_count': state['harsh_brake_count'],
+                'sudden_accel_count': state['sudden_accel_count'],
+                'idle_count': state['idle_count']
+            }
+        
+        # Persist events and update scores off the event loop, after releasing
+        # the stripe so other drivers don't wait on database I/O; the session
+        # is synchronous, so run it in a worker thread
+        if persist:
+            await asyncio.to_thread(
+                _persist_events_and_scores,
+                driver_id, track_id, timestamp, events, snapshot, driver_pk, trip_pk
+            )
+        
+        # Push the score and any events to dashboards, encoded once per message
+        if has_clients:
+            await _broadcast_result(manager, result)
         
-        # Prepare response
-        state = driver_states[driver_id]
-        result = {
-            'driver_id': driver_id,
-            'timestamp': timestamp.isoformat(),
-            'lat': lat,
-            'lon': lon,
-            'speed_kph': speed_kph,
-            'acceleration_kph_s': acceleration_kph_s,
-            'events': events,
-            'risk_score': risk_score,
-            'overspeed_count': state['overspeed_count'],
-            'harsh_brake_count': state['harsh_brake_count'],
-            'sudden_accel_count': state['sudden_accel_count'],
-            'idle_count': state['idle_count']
-        }
         return result
         
     except Exception as e:
-        print(f"=== Error in handle_point ===")
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("handle_point failed: %s", e)
+        if isinstance(payload, Telemetry):
+            payload = asdict(payload)
         # Return a minimal result to prevent simulation from stopping
         return {
             'driver_id': payload.get('driver_id', 'unknown'),
@@ -191,68 +415,205 @@ async def handle_point(payload: Dict, manager) -> Dict:
             'speed_kph': payload.get('speed_kph', 0.0),
             'acceleration_kph_s': 0.0,
             'events': [],
-            'risk_score': 100,
+            'risk_score': config.score_base,
             'overspeed_count': 0,
             'harsh_brake_count': 0,
             'sudden_accel_count': 0,
             'idle_count': 0
         }
 
-async def _persist_events_and_scores(driver_id: str, track_id: str, timestamp: datetime, events: List[Dict], risk_score: int):
-    """Persist events and update driver scores."""
-    from .persistence import persist_event, ensure_trip_exists, upsert_driver_score
-    from .db import SessionLocal
+async def _broadcast_result(manager, result: Dict):
+    """Broadcast the score update and detected events of a processed point."""
+    score_update = ScoreUpdate(
+        driver_id=result['driver_id'],
+        risk_score=result['risk_score'],
+        overspeed_count=result['overspeed_count'],
+        harsh_brake_count=result['harsh_brake_count'],
+        sudden_accel_count=result['sudden_accel_count'],
+        idle_count=result['idle_count']
+    )
+    await manager.broadcast_bytes(orjson.dumps(Message("score", score_update), default=orjson_default))
+    
+    for event in result['events']:
+        await manager.broadcast_bytes(orjson.dumps(Message("event", event.to_payload()), default=orjson_default))
+
+def _persist_events_and_scores(driver_id: str, track_id: str, timestamp: datetime, events: List[EventRec], state: Dict,
+                               driver_pk: Optional[int] = None, trip_pk: Optional[int] = None):
+    """Persist events and update driver scores (blocking, run in a worker thread).
+    
+    ``driver_pk``/``trip_pk`` are used as-is when given; otherwise they are
+    resolved from ``driver_id`` and ``track_id``.
+    """
+    from .persistence import ensure_trip_exists
+    from .db import SessionLocal, resolve_driver_id
     
     db = SessionLocal()
     try:
-        # Extract numeric driver ID from string like "driver_1" -> 1
-        try:
-            numeric_driver_id = int(driver_id.split('_')[1])
-        except (ValueError, IndexError):
-            print(f"Warning: Could not parse driver_id '{driver_id}', using 1 as fallback")
-            numeric_driver_id = 1
+        # Resolve the driver's primary key from the memoized map; fall back
+        # to the numeric suffix of ids like "driver_1" for unknown drivers
+        numeric_driver_id = driver_pk
+        if numeric_driver_id is None:
+            numeric_driver_id = resolve_driver_id(db, driver_id)
+        if numeric_driver_id is None:
+            try:
+                numeric_driver_id = int(driver_id.split('_')[1])
+            except (ValueError, IndexError):
+                logger.warning("Could not parse driver_id %r, using 1 as fallback", driver_id)
+                numeric_driver_id = 1
         
         # Ensure trip exists
-        trip = ensure_trip_exists(db, track_id, numeric_driver_id, timestamp)
+        if trip_pk is None:
+            trip_pk = ensure_trip_exists(db, track_id, numeric_driver_id, timestamp).id
         
-        # Persist each event
-        for event in events:
-            # Convert ISO string timestamp back to datetime for database storage
-            event_timestamp = datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
-            
-            persist_event(
-                db=db,
-                trip_id=trip.id,
-                driver_id=numeric_driver_id,
-                timestamp=event_timestamp,
-                lat=event['lat'],
-                lon=event['lon'],
-                speed_kph=event['speed_kph'],
-                acceleration_kph_s=event['acceleration_kph_s'],
-                event_type=event['event_type'],
-                meta=event.get('meta', {})
+        # Buffer the events; they are inserted in batches across points
+        rows = [dict(event._asdict(), trip_id=trip_pk, driver_id=numeric_driver_id) for event in events]
+        with _pending_events_lock:
+            _buffer_events(rows)
+            flush_due = (
+                len(_pending_events) >= config.event_flush_rows or
+                time.monotonic() - _last_events_flush >= config.event_flush_interval_seconds
             )
+        if flush_due:
+            flush_pending_events()
         
-        # Update driver score
-        if driver_id in driver_states:
-            state = driver_states[driver_id]
-            upsert_driver_score(
-                db=db,
-                driver_id=numeric_driver_id,
-                date=timestamp.date(),
-                avg_speed=state.get('last_speed_kph', 0.0),
-                overspeed_count=state.get('overspeed_count', 0),
-                harsh_brake_count=state.get('harsh_brake_count', 0),
-                idle_count=state.get('idle_count', 0),
-                risk_score=risk_score
-            )
+        # Record the latest counters; flush_dirty_scores writes them out
+        if state:
+            with _dirty_scores_lock:
+                _dirty_scores[(numeric_driver_id, timestamp.date())] = {
+                    'avg_speed': state.get('last_speed_kph', 0.0),
+                    'overspeed_count': state.get('overspeed_count', 0),
+                    'harsh_brake_count': state.get('harsh_brake_count', 0),
+                    'idle_count': state.get('idle_count', 0)
+                }
+    
+    except Exception as e:
+        logger.exception("Error persisting events: %s", e)
+    finally:
+        db.close()
+
+def _buffer_events(rows: List[Dict], front: bool = False):
+    """Add rows to the event buffer, at the back or the front (lock held).
+    
+    Once the buffer is full the oldest rows are dropped, with a warning.
+    """
+    dropped = len(_pending_events) + len(rows) - EVENT_BUFFER_MAX_ROWS
+    if dropped > 0:
+        logger.warning("Event buffer full, dropping %d oldest rows", dropped)
+    if front:
+        rows = rows + list(_pending_events)
+        _pending_events.clear()
+    _pending_events.extend(rows)
+
+def _insert_event_rows(rows: List[Dict]) -> Tuple[int, List[Dict]]:
+    """Insert event rows (blocking); returns the inserted count and the rows to retry.
     
+    A batch rejected for its data is split in halves to isolate the bad rows,
+    which are logged and dropped. Any other error (e.g. the database being
+    unreachable) hands the rows back for a later flush.
+    """
+    from .persistence import persist_events
+    from .db import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        return persist_events(db, rows), []
+    except (DataError, IntegrityError) as e:
+        db.rollback()
+        if len(rows) == 1:
+            logger.error("Dropping event row the database rejects: %r (%s)", rows[0], e)
+            return 0, []
     except Exception as e:
-        print(f"Error persisting events: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error flushing %d buffered events: %s", len(rows), e)
+        return 0, rows
     finally:
         db.close()
+    
+    mid = len(rows) // 2
+    inserted_head, retry_head = _insert_event_rows(rows[:mid])
+    inserted_tail, retry_tail = _insert_event_rows(rows[mid:])
+    return inserted_head + inserted_tail, retry_head + retry_tail
+
+def flush_pending_events() -> int:
+    """Insert all buffered events in one batch (blocking); returns the row count."""
+    global _last_events_flush
+    
+    # One flush at a time keeps rows in order; the buffer lock is only held
+    # to take the rows, not through the INSERT
+    with _events_flush_lock:
+        with _pending_events_lock:
+            rows = list(_pending_events)
+            _pending_events.clear()
+            _last_events_flush = time.monotonic()
+        if not rows:
+            return 0
+        
+        inserted, retry = _insert_event_rows(rows)
+        if retry:
+            # Keep them ahead of rows buffered since, for the next flush
+            with _pending_events_lock:
+                _buffer_events(retry, front=True)
+        return inserted
+
+def flush_dirty_scores() -> int:
+    """Upsert the latest counters of every dirty driver score (blocking); returns the row count.
+    
+    Each row is written in its own savepoint, so a score the database
+    rejects is logged and dropped without undoing the rest. If the flush
+    fails as a whole, its scores are kept for the next one unless newer
+    counters for the same driver and day have been recorded meanwhile.
+    """
+    from .persistence import stage_driver_score
+    from .db import SessionLocal
+    from .cache import DRIVERS_CACHE_KEY, invalidate
+    
+    # One flush at a time, so an older snapshot never overwrites a newer one;
+    # the map lock is only held to take the scores, not through the upserts
+    with _scores_flush_lock:
+        with _dirty_scores_lock:
+            items = list(_dirty_scores.items())
+            _dirty_scores.clear()
+        if not items:
+            return 0
+        
+        written = 0
+        db = SessionLocal()
+        try:
+            # The risk score itself is computed in SQL; one commit per flush
+            for (driver_pk, day), counters in items:
+                try:
+                    with db.begin_nested():
+                        stage_driver_score(db=db, driver_id=driver_pk, date=day, **counters)
+                    written += 1
+                except (DataError, IntegrityError) as e:
+                    logger.error("Dropping score of driver %s on %s the database rejects: %s", driver_pk, day, e)
+            db.commit()
+        except Exception as e:
+            logger.exception("Error flushing %d driver scores: %s", len(items), e)
+            with _dirty_scores_lock:
+                for key, counters in items:
+                    _dirty_scores.setdefault(key, counters)
+            return 0
+        finally:
+            db.close()
+        
+        # Current scores changed, drop the cached driver list
+        if written:
+            invalidate(DRIVERS_CACHE_KEY)
+        return written
+
+async def run_score_flusher(interval: Optional[float] = None):
+    """Flush dirty driver scores every ``interval`` seconds until cancelled.
+    
+    Buffered events are flushed on the same tick once their flush interval
+    has passed, so they are written even when no new events arrive.
+    """
+    if interval is None:
+        interval = config.score_flush_interval_seconds
+    while True:
+        await asyncio.sleep(interval)
+        if time.monotonic() - _last_events_flush >= config.event_flush_interval_seconds:
+            await asyncio.to_thread(flush_pending_events)
+        await asyncio.to_thread(flush_dirty_scores)
 
 def get_driver_state(driver_id: str) -> Optional[Dict]:
     """Get current state for a driver."""
@@ -260,5 +621,14 @@ def get_driver_state(driver_id: str) -> Optional[Dict]:
 
 def reset_driver_state(driver_id: str):
     """Reset state for a driver (useful for testing)."""
-    if driver_id in driver_states:
-        del driver_states[driver_id]
+    driver_states.pop(driver_id, None)
+
+def _set_counts(driver_id: str, overspeed: int = 0, harsh_brake: int = 0, sudden_accel: int = 0, idle: int = 0):
+    """Set a driver's event counters directly, creating its state if needed (for testing)."""
+    state = driver_states.get(driver_id)
+    if state is None:
+        state = driver_states[driver_id] = _new_driver_state(0.0, _EPOCH)
+    state['overspeed_count'] = overspeed
+    state['harsh_brake_count'] = harsh_brake
+    state['sudden_accel_count'] = sudden_accel
+    state['idle_count'] = idle
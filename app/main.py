@@ -2,12 +2,15 @@ from fastapi import FastAPI, WebSocket, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
-from fastapi import Request
 from pydantic import BaseModel
 from .db import init_db
 from .api.endpoints import router as api_router
 from .wsmanager import ConnectionManager
 from .simulator import start_simulation, stop_simulation, is_running
+from .detection import flush_dirty_scores, flush_pending_events, run_score_flusher
+from .utils.orjson_response import ORJSONResponse
+from .utils.static_files import CachedStaticFiles
+import asyncio
 import os
 
 class SimulationRequest(BaseModel):
@@ -17,11 +20,13 @@ class SimulationRequest(BaseModel):
 app = FastAPI(
     title="AI Driver Behavior Analytics MVP",
     description="Real-time driver behavior monitoring system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# Setup templates
+# Setup templates and static assets
 templates = Jinja2Templates(directory="app/templates")
+app.mount("/static", CachedStaticFiles(directory="app/static"), name="static")
 
 # Create connection manager
 manager = ConnectionManager()
@@ -31,18 +36,34 @@ app.include_router(api_router, prefix="/api")
 
 @app.on_event("startup")
 async def startup():
-    """Initialize database on startup."""
-    init_db()
+    """Initialize database, cache the dashboard drivers, prerender the dashboard and start the score flusher on startup."""
+    app.state.default_drivers = init_db()
+    app.state.dashboard_html = _render_dashboard()
+    app.state.score_flusher = asyncio.create_task(run_score_flusher())
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the score flusher and write out buffered events and scores on shutdown."""
+    score_flusher = getattr(app.state, "score_flusher", None)
+    if score_flusher is not None:
+        score_flusher.cancel()
+    await asyncio.to_thread(flush_pending_events)
+    await asyncio.to_thread(flush_dirty_scores)
 
 @app.get("/")
 async def root():
     """Root endpoint - redirect to dashboard."""
     return {"message": "AI Driver Behavior Analytics MVP", "dashboard": "/dashboard"}
 
+def _render_dashboard() -> str:
+    """Render the dashboard template; it has no per-request context."""
+    return templates.get_template("dashboard.html").render()
+
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request):
+async def dashboard():
     """Serve the dashboard page."""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    # Rendered once at startup
+    return HTMLResponse(app.state.dashboard_html)
 
 @app.get("/health")
 async def health_check():
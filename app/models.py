@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -11,6 +11,7 @@ class Driver(Base):
     external_id = Column(String(128), unique=True, nullable=False)
     name = Column(String(255))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    trips = relationship("Trip", back_populates="driver")
 
 class Trip(Base):
     __tablename__ = "trips"
@@ -20,7 +21,11 @@ class Trip(Base):
     start_time = Column(DateTime(timezone=True))
     end_time = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    driver = relationship("Driver")
+    driver = relationship("Driver", back_populates="trips")
+
+    __table_args__ = (
+        Index("ix_trips_driver_start", driver_id, start_time.desc()),
+    )
 
 class Event(Base):
     __tablename__ = "events"
@@ -36,6 +41,13 @@ class Event(Base):
     meta = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_events_driver_ts", driver_id, timestamp.desc()),
+        Index("ix_events_trip", trip_id),
+        # Per-type counts in get_event_stats when filtered by driver
+        Index("ix_events_driver_type", driver_id, event_type),
+    )
+
 class DriverScore(Base):
     __tablename__ = "driver_scores"
     id = Column(Integer, primary_key=True)
@@ -47,3 +59,16 @@ class DriverScore(Base):
     idle_count = Column(Integer)
     risk_score = Column(Integer)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Covers the latest-score lookup in list_drivers (index-only scan on Postgres)
+        Index(
+            "ix_driver_scores_driver_created", driver_id, created_at.desc(), id.desc(),
+            postgresql_include=[
+                "date", "avg_speed", "overspeed_count", "harsh_brake_count",
+                "idle_count", "risk_score"
+            ]
+        ),
+        # One score row per driver and day; also the upsert conflict target
+        Index("ix_driver_scores_driver_date", driver_id, date.desc(), unique=True),
+    )
@@ -1,8 +1,12 @@
 from datetime import datetime, date
 from typing import Dict, List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy import case, delete, insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, raiseload
 from .models import Driver, Trip, Event, DriverScore
 from .db import SessionLocal
+from .config import config
 
 def persist_event(
     db: Session,
@@ -33,20 +37,34 @@ def persist_event(
     db.refresh(event)
     return event
 
+def persist_events(db: Session, rows: List[Dict]) -> int:
+    """Persist a batch of events with a single executemany INSERT."""
+    if not rows:
+        return 0
+    db.execute(insert(Event), rows)
+    db.commit()
+    return len(rows)
+
+def _upsert_insert(db: Session):
+    """Dialect-specific insert() that supports ON CONFLICT clauses."""
+    return sqlite_insert if db.get_bind().dialect.name == "sqlite" else pg_insert
+
 def ensure_trip_exists(db: Session, track_id: str, driver_id: int, start_time: datetime) -> Trip:
     """Ensure a trip exists in the database, create if not."""
     trip = db.query(Trip).filter(Trip.track_id == track_id).first()
     
     if not trip:
-        trip = Trip(
+        # Lost races against a concurrent insert of the same track are
+        # absorbed by the unique track_id instead of raising
+        stmt = _upsert_insert(db)(Trip).values(
             track_id=track_id,
             driver_id=driver_id,
             start_time=start_time,
             end_time=None  # Will be updated when trip ends
-        )
-        db.add(trip)
+        ).on_conflict_do_nothing(index_elements=[Trip.track_id])
+        db.execute(stmt)
         db.commit()
-        db.refresh(trip)
+        trip = db.query(Trip).filter(Trip.track_id == track_id).one()
     
     return trip
 
@@ -57,6 +75,16 @@ def update_trip_end_time(db: Session, track_id: str, end_time: datetime):
         trip.end_time = end_time
         db.commit()
 
+def _risk_score_expr(overspeed_count, harsh_brake_count, idle_count):
+    """SQL expression for max(0, base - weighted penalty) over score counters."""
+    remaining = literal(config.score_base) - (
+        overspeed_count * config.score_overspeed_weight +
+        harsh_brake_count * config.score_harsh_brake_weight +
+        idle_count * config.score_idle_weight
+    )
+    # CASE rather than GREATEST so the same statement runs on SQLite
+    return case((remaining < 0, 0), else_=remaining)
+
 def upsert_driver_score(
     db: Session,
     driver_id: int,
@@ -65,40 +93,54 @@ def upsert_driver_score(
     overspeed_count: int,
     harsh_brake_count: int,
     idle_count: int,
-    risk_score: int
+    risk_score: Optional[int] = None
 ) -> DriverScore:
-    """Upsert driver score for a specific date."""
-    # Check if score exists for this driver and date
-    existing_score = db.query(DriverScore).filter(
-        DriverScore.driver_id == driver_id,
-        DriverScore.date == date
-    ).first()
+    """Upsert driver score for a specific date.
     
-    if existing_score:
-        # Update existing score
-        existing_score.avg_speed = avg_speed
-        existing_score.overspeed_count = overspeed_count
-        existing_score.harsh_brake_count = harsh_brake_count
-        existing_score.idle_count = idle_count
-        existing_score.risk_score = risk_score
-        db.commit()
-        db.refresh(existing_score)
-        return existing_score
-    else:
-        # Create new score
-        score = DriverScore(
-            driver_id=driver_id,
-            date=date,
-            avg_speed=avg_speed,
-            overspeed_count=overspeed_count,
-            harsh_brake_count=harsh_brake_count,
-            idle_count=idle_count,
-            risk_score=risk_score
+    Runs as a single INSERT ... ON CONFLICT DO UPDATE on (driver_id, date).
+    Without an explicit risk_score, the score is computed by the database from
+    the counters and the configured weights.
+    """
+    score = stage_driver_score(
+        db, driver_id, date, avg_speed, overspeed_count, harsh_brake_count, idle_count, risk_score
+    )
+    db.commit()
+    return score
+
+def stage_driver_score(
+    db: Session,
+    driver_id: int,
+    date: date,
+    avg_speed: float,
+    overspeed_count: int,
+    harsh_brake_count: int,
+    idle_count: int,
+    risk_score: Optional[int] = None
+) -> DriverScore:
+    """Like upsert_driver_score, but leaves the commit to the caller."""
+    stmt = _upsert_insert(db)(DriverScore).values(
+        driver_id=driver_id,
+        date=date,
+        avg_speed=avg_speed,
+        overspeed_count=overspeed_count,
+        harsh_brake_count=harsh_brake_count,
+        idle_count=idle_count,
+        risk_score=risk_score if risk_score is not None else _risk_score_expr(
+            literal(overspeed_count), literal(harsh_brake_count), literal(idle_count)
         )
-        db.add(score)
-        db.commit()
-        db.refresh(score)
-        return score
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DriverScore.driver_id, DriverScore.date],
+        set_={
+            "avg_speed": stmt.excluded.avg_speed,
+            "overspeed_count": stmt.excluded.overspeed_count,
+            "harsh_brake_count": stmt.excluded.harsh_brake_count,
+            "idle_count": stmt.excluded.idle_count,
+            "risk_score": stmt.excluded.risk_score
+        }
+    ).returning(DriverScore)
+    
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
 
 def get_driver_events(
     db: Session,
@@ -106,8 +148,12 @@ def get_driver_events(
     limit: int = 100,
     offset: int = 0
 ) -> List[Event]:
-    """Get recent events for a driver."""
-    return db.query(Event).filter(
+    """Get recent events for a driver.
+    
+    Relationships are not loaded; accessing one raises instead of issuing a
+    query per row (the same applies to the other listing helpers).
+    """
+    return db.query(Event).options(raiseload("*")).filter(
         Event.driver_id == driver_id
     ).order_by(
         Event.timestamp.desc()
@@ -120,7 +166,7 @@ def get_driver_trips(
     offset: int = 0
 ) -> List[Trip]:
     """Get trips for a driver."""
-    return db.query(Trip).filter(
+    return db.query(Trip).options(raiseload("*")).filter(
         Trip.driver_id == driver_id
     ).order_by(
         Trip.start_time.desc()
@@ -135,48 +181,66 @@ def get_driver_scores(
     from datetime import timedelta
     start_date = date.today() - timedelta(days=days)
     
-    return db.query(DriverScore).filter(
+    return db.query(DriverScore).options(raiseload("*")).filter(
         DriverScore.driver_id == driver_id,
         DriverScore.date >= start_date
     ).order_by(DriverScore.date.desc()).all()
 
 def get_event_stats(db: Session, driver_id: Optional[int] = None) -> Dict:
     """Get event statistics."""
-    query = db.query(Event)
-    
-    if driver_id:
-        query = query.filter(Event.driver_id == driver_id)
-    
-    # Count events by type
     from sqlalchemy import func
-    event_counts = db.query(
+    
+    # Count events by type, with the overall total as a window sum over the
+    # per-type counts, in a single aggregate query
+    count = func.count(Event.id)
+    stmt = select(
         Event.event_type,
-        func.count(Event.id).label('count')
-    ).group_by(Event.event_type).all()
+        count.label('count'),
+        func.sum(count).over().label('total')
+    ).group_by(Event.event_type)
+    
+    if driver_id is not None:
+        stmt = stmt.where(Event.driver_id == driver_id)
+    
+    rows = db.execute(stmt).all()
     
     stats = {
-        'total_events': sum(count for _, count in event_counts),
-        'by_type': {event_type: count for event_type, count in event_counts}
+        'total_events': int(rows[0].total) if rows else 0,
+        'by_type': {row.event_type: row.count for row in rows}
     }
     
     return stats
 
+# Rows removed per DELETE statement (and transaction) in cleanup_old_data
+CLEANUP_CHUNK_ROWS = 10000
+
+def _delete_in_chunks(db: Session, model, condition) -> int:
+    """Delete matching rows in bounded chunks, committing after each one."""
+    deleted = 0
+    while True:
+        chunk_ids = select(model.id).where(condition).limit(CLEANUP_CHUNK_ROWS)
+        result = db.execute(
+            delete(model).where(model.id.in_(chunk_ids)).execution_options(synchronize_session=False)
+        )
+        db.commit()
+        if result.rowcount <= 0:
+            return deleted
+        deleted += result.rowcount
+
 def cleanup_old_data(db: Session, days_to_keep: int = 90):
-    """Clean up old events and scores (optional maintenance function)."""
+    """Clean up old events and scores (optional maintenance function).
+    
+    Rows are deleted in chunks of CLEANUP_CHUNK_ROWS so locks and WAL stay
+    bounded on large tables.
+    """
     from datetime import timedelta
     cutoff_date = date.today() - timedelta(days=days_to_keep)
     
     # Delete old events
-    old_events = db.query(Event).filter(
-        Event.timestamp < cutoff_date
-    ).delete()
+    old_events = _delete_in_chunks(db, Event, Event.timestamp < cutoff_date)
     
     # Delete old scores
-    old_scores = db.query(DriverScore).filter(
-        DriverScore.date < cutoff_date
-    ).delete()
-    
-    db.commit()
+    old_scores = _delete_in_chunks(db, DriverScore, DriverScore.date < cutoff_date)
     
     return {
         'deleted_events': old_events,
@@ -1,63 +1,111 @@
 import asyncio
+import logging
 import pandas as pd
+import numpy as np
 import math
+import orjson
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 from .config import TRACKSPOINTS_CSV, EMIT_INTERVAL_SECONDS
 from .wsmanager import ConnectionManager
 from .db import SessionLocal
 from .models import Driver, Trip
-import traceback
-from .detection import handle_point
+from .detection import Message, Telemetry, handle_point, flush_dirty_scores, flush_pending_events
 
-# Global state
-RUNNING = False
-current_task: Optional[asyncio.Task] = None
+logger = logging.getLogger(__name__)
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two GPS points in kilometers using Haversine formula."""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lon1_rad = math.radians(lon1)
-    lat2_rad = math.radians(lat2)
-    lon2_rad = math.radians(lon2)
+@dataclass
+class SimulationState:
+    """Run state of the simulator.
     
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
+    ``stop_event`` wakes the point loop as soon as a stop is requested,
+    instead of it noticing a flag after the current sleep. Each run gets a
+    fresh one, so a finishing run never sees the next run's stop or start.
+    """
+    running: bool = False
+    task: Optional[asyncio.Task] = None
+    stop_event: asyncio.Event = field(default_factory=asyncio.Event)
+
+# Module-wide run state, shared by the API endpoints
+state = SimulationState()
+
+EARTH_RADIUS_KM = 6371.0
+DEG2RAD = math.pi / 180.0
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two GPS points in kilometers using Haversine formula.
     
-    a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
+    Uses the atan2 form, which stays well conditioned over the whole range,
+    unlike asin(sqrt(a)) near antipodal points.
+    """
+    lat1_rad = lat1 * DEG2RAD
+    lat2_rad = lat2 * DEG2RAD
+    sin_dlat = math.sin((lat2_rad - lat1_rad) * 0.5)
+    sin_dlon = math.sin((lon2 - lon1) * (DEG2RAD * 0.5))
     
-    return R * c
+    a = sin_dlat * sin_dlat + math.cos(lat1_rad) * math.cos(lat2_rad) * sin_dlon * sin_dlon
+    # Rounding can push a just past 1 for antipodal points
+    if a > 1.0:
+        a = 1.0
+    return 2.0 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1.0 - a))
 
 def calculate_speed_kph(lat1, lon1, time1, lat2, lon2, time2):
     """Calculate speed in km/h between two GPS points."""
-    # Calculate distance in kilometers
-    distance_km = calculate_distance(lat1, lon1, lat2, lon2)
-    
-    # Calculate time difference in hours
     time_diff_hours = (time2 - time1).total_seconds() / 3600
     
-    # Avoid division by zero
+    # Duplicate or out-of-order timestamps have no meaningful speed
     if time_diff_hours <= 0:
         return 0.0
     
-    # Calculate speed in km/h
-    speed_kph = distance_km / time_diff_hours
+    return calculate_distance(lat1, lon1, lat2, lon2) / time_diff_hours
+
+def haversine_vector(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Element-wise Haversine distance in kilometers between arrays of GPS points.
+    
+    Same atan2 form as calculate_distance, so both agree point for point.
+    """
+    lat1_rad = lat1 * DEG2RAD
+    lat2_rad = lat2 * DEG2RAD
+    sin_dlat = np.sin((lat2_rad - lat1_rad) * 0.5)
+    sin_dlon = np.sin((lon2 - lon1) * (DEG2RAD * 0.5))
+    
+    a = sin_dlat * sin_dlat + np.cos(lat1_rad) * np.cos(lat2_rad) * sin_dlon * sin_dlon
+    # Rounding can push a just past 1 for antipodal points
+    a = np.minimum(a, 1.0)
+    return 2.0 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a))
+
+def track_speeds_kph(lats: np.ndarray, lons: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """Speed in km/h at each point of a track, from the preceding point.
     
-    return speed_kph
+    The first point, and points with a non-positive time delta, get 0.
+    Times are a datetime64 array.
+    """
+    if len(lats) == 0:
+        return np.zeros(0)
+    dists = haversine_vector(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    dt_h = np.diff(times).astype('timedelta64[ns]').astype(np.float64) / 3.6e12
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = np.where(dt_h > 0, dists / dt_h, 0.0)
+    return np.concatenate(([0.0], speeds))
 
 async def start_simulation(manager: ConnectionManager, csv_path: str = None, interval: float = None, driver_id: str = None):
     """Start the GPS simulation."""
-    global RUNNING, current_task
-    
-    if RUNNING:
-        print("=== Simulation already running ===")
+    if state.running:
+        logger.info("Simulation already running")
         return
     
-    print("=== Starting Simulation ===")
-    RUNNING = True
+    state.running = True
+    stop_event = state.stop_event = asyncio.Event()
+    
+    # A run that was just stopped may still be flushing; let it finish
+    # first. A stop sent meanwhile sets this run's event and skips the run
+    previous = state.task
+    if previous is not None and not previous.done():
+        await asyncio.wait([previous])
+        if stop_event.is_set():
+            logger.info("Simulation stopped before it started")
+            return
     
     # Use default path if not provided
     if csv_path is None:
@@ -67,243 +115,197 @@ async def start_simulation(manager: ConnectionManager, csv_path: str = None, int
     if interval is None:
         interval = EMIT_INTERVAL_SECONDS
     
-    print(f"=== Simulation Debug Info ===")
-    print(f"CSV Path: {csv_path}")
-    print(f"Interval: {interval} seconds")
-    print(f"Selected Driver ID: {driver_id}")
+    logger.info("Starting simulation: csv=%s interval=%ss driver=%s", csv_path, interval, driver_id)
     
     try:
         # Start simulation in background
-        current_task = asyncio.create_task(_run_simulation(manager, csv_path, interval, driver_id))
-        await current_task
+        task = state.task = asyncio.create_task(
+            _run_simulation(manager, csv_path, interval, driver_id, stop_event)
+        )
+        await task
     except Exception as e:
-        print(f"=== Simulation Error ===")
-        print(f"Error: {e}")
-        traceback.print_exc()
-        RUNNING = False
+        logger.exception("Simulation error: %s", e)
     finally:
-        print("=== Simulation Task Completed ===")
-        RUNNING = False
+        logger.info("Simulation task completed")
+        # Only the run that owns the state may mark it idle
+        if state.stop_event is stop_event:
+            state.running = False
 
 def stop_simulation():
     """Stop the GPS simulation."""
-    global RUNNING, current_task
-    
-    print("=== Stopping Simulation ===")
-    RUNNING = False
-    
-    if current_task and not current_task.done():
-        print("=== Cancelling current task ===")
-        current_task.cancel()
+    logger.info("Stopping simulation")
+    state.running = False
+    state.stop_event.set()
     
     return {"message": "simulation stopped"}
 
 def is_running():
     """Check if simulation is currently running."""
-    return RUNNING
+    return state.running
 
-async def _run_simulation(manager: ConnectionManager, csv_path: str, interval: float, selected_driver_id: str = None):
-    """Internal simulation runner."""
-    global RUNNING
-    
-    print(f"=== _run_simulation started ===")
-    print(f"RUNNING flag: {RUNNING}")
+def _load_df(csv_path: str) -> pd.DataFrame:
+    """Read the trackpoints CSV in one typed pass, sorted by track and time."""
+    df = pd.read_csv(
+        csv_path,
+        usecols=['track_id', 'latitude', 'longitude', 'time'],
+        dtype={'track_id': 'int32', 'latitude': 'float64', 'longitude': 'float64'},
+        parse_dates=['time'],
+        engine='c'
+    )
+    return df.sort_values(['track_id', 'time'])
+
+def _ensure_track_ids(driver_external_id: str, track_id: int, start_time: datetime, end_time: datetime) -> Tuple[int, int]:
+    """Ensure the track's driver and trip exist and return their ids (blocking).
     
+    Runs as one transaction, committed when the block exits.
+    """
+    with SessionLocal.begin() as db:
+        driver = db.query(Driver).filter(Driver.external_id == driver_external_id).first()
+        if not driver:
+            logger.info("Creating driver %s", driver_external_id)
+            driver = Driver(external_id=driver_external_id, name=f"Driver {track_id}")
+            db.add(driver)
+            db.flush()
+        
+        # Ensure trip exists
+        trip = db.query(Trip).filter(Trip.track_id == str(track_id)).first()
+        if not trip:
+            logger.info("Creating trip for track %s", track_id)
+            trip = Trip(
+                track_id=str(track_id),
+                driver_id=driver.id,
+                start_time=start_time,
+                end_time=end_time
+            )
+            db.add(trip)
+            db.flush()
+        
+        return driver.id, trip.id
+
+async def _run_simulation(manager: ConnectionManager, csv_path: str, interval: float, selected_driver_id: str = None,
+                          stop_event: Optional[asyncio.Event] = None):
+    """Internal simulation runner; ``stop_event`` defaults to the current run's."""
+    if stop_event is None:
+        stop_event = state.stop_event
     try:
-        # Read CSV data
-        print("=== Reading CSV data ===")
-        df = pd.read_csv(csv_path)
-        df['time'] = pd.to_datetime(df['time'])
-        df = df.sort_values(['track_id', 'time'])
+        # Parsing a large CSV takes seconds; do it off the event loop
+        df = await asyncio.to_thread(_load_df, csv_path)
         
-        print(f"=== Data Loaded ===")
-        print(f"Total data points: {len(df)}")
-        print(f"Available track_ids: {sorted(df['track_id'].unique())}")
+        logger.info("Loaded %d data points from %s", len(df), csv_path)
         
         # Filter by selected driver if provided
         if selected_driver_id:
-            print(f"=== Filtering for driver {selected_driver_id} ===")
             # Map driver_id to track_id (assuming driver_1 = track 1, etc.)
             try:
                 track_id = int(selected_driver_id.split('_')[1])
                 df = df[df['track_id'] == track_id]
-                print(f"Filtered data points: {len(df)}")
+                logger.info("Filtered %d data points for driver %s", len(df), selected_driver_id)
                 unique_tracks = [track_id]
             except ValueError:
-                print(f"Invalid driver_id format: {selected_driver_id}")
-                RUNNING = False
+                logger.warning("Invalid driver_id format: %s", selected_driver_id)
                 return
         else:
             # Use first 3 tracks as default
-            unique_tracks = sorted(df['track_id'].unique())[:3]
-            print(f"=== Using tracks: {unique_tracks} ===")
+            unique_tracks = sorted(df['track_id'].unique().tolist())[:3]
+            logger.info("Using tracks: %s", unique_tracks)
+        
+        # Split into tracks once; each group keeps the (track_id, time) order
+        groups = {tid: group for tid, group in df.groupby('track_id', sort=False)}
         
         # Process each track
         for track_id in unique_tracks:
-            if not RUNNING:
-                print(f"=== Simulation stopped by user for track {track_id} ===")
+            if stop_event.is_set():
+                logger.info("Simulation stopped by user for track %s", track_id)
                 break
-                
-            print(f"=== Processing track {track_id} ===")
-            group = df[df['track_id'] == track_id].copy()
-            group = group.sort_values('time')
             
-            print(f"Selected track {track_id} with {len(group)} points")
-            print(f"Time range: {group['time'].min()} to {group['time'].max()}")
-            print(f"Estimated duration: {len(group) * interval:.1f} seconds ({len(group) * interval / 60:.1f} minutes)")
+            group = groups.get(track_id)
+            if group is None:
+                logger.warning("No data points for track %s", track_id)
+                continue
+            
+            logger.info(
+                "Processing track %s: %d points from %s to %s, about %.1f minutes",
+                track_id, len(group), group['time'].min(), group['time'].max(),
+                len(group) * interval / 60
+            )
             
-            # Ensure driver exists in DB
+            # Ensure driver and trip exist, in a worker thread since the
+            # session is synchronous; their primary keys go along with every
+            # point so detection doesn't look them up again
             driver_external_id = f"driver_{track_id}"
-            db = SessionLocal()
             try:
-                driver = db.query(Driver).filter(Driver.external_id == driver_external_id).first()
-                if not driver:
-                    print(f"Creating driver {driver_external_id}")
-                    driver = Driver(external_id=driver_external_id, name=f"Driver {track_id}")
-                    db.add(driver)
-                    db.commit()
-                    db.refresh(driver)
-                
-                # Ensure trip exists
-                trip = db.query(Trip).filter(Trip.track_id == str(track_id)).first()
-                if not trip:
-                    print(f"Creating trip for track {track_id}")
-                    trip = Trip(
-                        track_id=str(track_id),
-                        driver_id=driver.id,
-                        start_time=group['time'].min(),
-                        end_time=group['time'].max()
-                    )
-                    db.add(trip)
-                    db.commit()
-                    db.refresh(trip)
-                
-                print(f"Driver ID: {driver.id}, Trip ID: {trip.id}")
-                
+                driver_pk, trip_pk = await asyncio.to_thread(
+                    _ensure_track_ids, driver_external_id, track_id,
+                    group['time'].min(), group['time'].max()
+                )
             except Exception as e:
-                print(f"=== Database Error for track {track_id} ===")
-                print(f"Error: {e}")
-                traceback.print_exc()
+                logger.exception("Database error for track %s: %s", track_id, e)
                 continue
-            finally:
-                db.close()
             
-            # Process each point in the track
+            # Compute speeds for the whole track in one vectorized pass
+            lats = group['latitude'].to_numpy(np.float64)
+            lons = group['longitude'].to_numpy(np.float64)
+            times = pd.DatetimeIndex(group['time'])
+            speeds = track_speeds_kph(lats, lons, times.to_numpy(dtype='datetime64[ns]'))
+            
+            # Process each point in the track; columns are converted to plain
+            # Python floats/datetimes once, not boxed per point
             point_count = 0
-            prev_lat = None
-            prev_lon = None
-            prev_time = None
+            track_key = str(track_id)
             
-            for _, row in group.iterrows():
-                if not RUNNING:
-                    print(f"=== Simulation stopped by user for track {track_id} ===")
-                    break
-                
+            for current_lat, current_lon, current_time, speed_kph in zip(
+                lats.tolist(), lons.tolist(), times.to_pydatetime().tolist(), speeds.tolist()
+            ):
                 point_count += 1
-                current_lat = float(row['latitude'])
-                current_lon = float(row['longitude'])
-                current_time = row['time']
-                
-                # Calculate speed from GPS coordinates
-                speed_kph = 0.0
-                if prev_lat is not None and prev_lon is not None and prev_time is not None:
-                    speed_kph = calculate_speed_kph(
-                        prev_lat, prev_lon, prev_time,
-                        current_lat, current_lon, current_time
-                    )
-                
-                # Create telemetry payload
-                telemetry_payload = {
-                    "driver_id": driver_external_id,
-                    "track_id": str(track_id),
-                    "timestamp": current_time.isoformat(),
-                    "lat": current_lat,
-                    "lon": current_lon,
-                    "speed_kph": speed_kph
-                }
                 
-                # Create WebSocket broadcast payload
-                ws_payload = {
-                    "type": "telemetry",
-                    "payload": telemetry_payload
-                }
+                # Create telemetry point; a slotted dataclass that orjson
+                # encodes directly, no per-point dict
+                telemetry = Telemetry(
+                    driver_external_id, track_key, current_time,
+                    current_lat, current_lon, speed_kph
+                )
                 
                 # Debug logging every 10 points
-                if point_count % 10 == 0:
-                    print(f"Processed {point_count}/{len(group)} points for track {track_id} ({point_count/len(group)*100:.1f}%)")
-                    print(f"  Current time: {current_time}")
-                    print(f"  Speed: {speed_kph:.1f} km/h")
-                    print(f"  RUNNING flag: {RUNNING}")
+                if point_count % 10 == 0 and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "Processed %d/%d points for track %s (time %s, speed %.1f km/h)",
+                        point_count, len(group), track_id, current_time, speed_kph
+                    )
                 
                 try:
-                    # Process through detection pipeline
-                    detection_result = await handle_point(telemetry_payload, manager)
-                    
-                    # Broadcast telemetry to WebSocket
+                    # Broadcast telemetry to WebSocket; nothing is built when
+                    # no dashboard is connected
                     if manager and manager.active_connections:
-                        await manager.broadcast(ws_payload)
-                        print(f"  ✓ Broadcasted telemetry point {point_count} to {len(manager.active_connections)} connections")
-                        
-                        # Broadcast score update if available
-                        if detection_result and 'risk_score' in detection_result:
-                            score_payload = {
-                                "type": "score",
-                                "payload": {
-                                    "driver_id": detection_result['driver_id'],
-                                    "risk_score": detection_result['risk_score'],
-                                    "overspeed_count": detection_result.get('overspeed_count', 0),
-                                    "harsh_brake_count": detection_result.get('harsh_brake_count', 0),
-                                    "sudden_accel_count": detection_result.get('sudden_accel_count', 0),
-                                    "idle_count": detection_result.get('idle_count', 0)
-                                }
-                            }
-                            await manager.broadcast(score_payload)
-                            print(f"  ✓ Broadcasted score update: {detection_result['risk_score']}")
-                        
-                        # Broadcast events if any detected
-                        if detection_result and detection_result.get('events'):
-                            for event in detection_result['events']:
-                                event_payload = {
-                                    "type": "event",
-                                    "payload": event
-                                }
-                                await manager.broadcast(event_payload)
-                                print(f"  ✓ Broadcasted event: {event['event_type']}")
-                    else:
-                        print(f"  ⚠️ No active WebSocket connections")
+                        await manager.broadcast_bytes(orjson.dumps(Message("telemetry", telemetry)))
+                    
+                    # Process through detection pipeline; it broadcasts the
+                    # score update and any detected events itself
+                    await handle_point(telemetry, manager, driver_pk, trip_pk)
                     
                 except Exception as e:
-                    print(f"=== Error processing point {point_count} ===")
-                    print(f"Error: {e}")
-                    traceback.print_exc()
+                    logger.exception("Error processing point %d of track %s: %s", point_count, track_id, e)
                     # Continue with next point instead of stopping
-                    continue
                 
-                # Update previous values for next iteration
-                prev_lat = current_lat
-                prev_lon = current_lon
-                prev_time = current_time
-                
-                # Sleep between points
+                # Wait out the interval, waking early if a stop is requested
                 try:
-                    await asyncio.sleep(interval)
-                except Exception as e:
-                    print(f"=== Error during sleep ===")
-                    print(f"Error: {e}")
-                    traceback.print_exc()
+                    await asyncio.wait_for(stop_event.wait(), timeout=interval)
+                    logger.info("Simulation stopped by user for track %s", track_id)
                     break
+                except asyncio.TimeoutError:
+                    pass
             
-            print(f"Completed track {track_id} - processed all {len(group)} points")
+            logger.info("Completed track %s - processed %d points", track_id, point_count)
         
-        print("=== Simulation completed - all tracks processed ===")
+        logger.info("Simulation completed - all tracks processed")
         
     except Exception as e:
-        print(f"=== Fatal simulation error ===")
-        print(f"Error: {e}")
-        traceback.print_exc()
+        logger.exception("Fatal simulation error: %s", e)
     finally:
-        print("=== _run_simulation ending ===")
-        RUNNING = False
+        if state.stop_event is stop_event:
+            state.running = False
+        # Write out events and scores still buffered
+        await asyncio.to_thread(flush_pending_events)
+        await asyncio.to_thread(flush_dirty_scores)
 
 async def _ensure_driver_exists(track_id: str) -> int:
     """Ensure driver exists in database and return driver_id."""
@@ -328,7 +330,7 @@ async def _ensure_driver_exists(track_id: str) -> int:
         return driver.id
         
     except Exception as e:
-        print(f"Error ensuring driver exists: {e}")
+        logger.exception("Error ensuring driver exists: %s", e)
         return 1  # Fallback driver ID
     finally:
         db.close()
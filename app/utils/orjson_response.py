@@ -0,0 +1,40 @@
+from collections.abc import Mapping
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, Sequence
+from uuid import UUID
+import orjson
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+def orjson_default(obj: Any) -> Any:
+    """Serialize database types orjson does not handle natively."""
+    if isinstance(obj, Mapping):
+        # SQLAlchemy RowMapping from .mappings() results
+        return dict(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, UUID):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+class ORJSONResponse(_ORJSONResponse):
+    """JSON response rendered by orjson, treating naive datetimes as UTC."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=ORJSON_OPTIONS)
+
+def iter_json_array(chunks: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """Encode chunks of items as one JSON array, calling orjson once per chunk."""
+    yield b"["
+    first = True
+    for chunk in chunks:
+        if not chunk:
+            continue
+        # Drop the brackets of each encoded chunk and join them with commas
+        body = orjson.dumps(chunk, default=orjson_default, option=ORJSON_OPTIONS)[1:-1]
+        if not first:
+            body = b"," + body
+        first = False
+        yield body
+    yield b"]"
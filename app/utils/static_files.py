@@ -0,0 +1,17 @@
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class CachedStaticFiles(StaticFiles):
+    """Static files served with long-lived immutable caching.
+    
+    Meant for content-hashed asset names: a changed file gets a new name, so
+    browsers and CDNs never need to revalidate a URL they have seen.
+    """
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
@@ -0,0 +1,53 @@
+import threading
+from typing import Any, Callable, Hashable, MutableMapping, Optional
+
+class StripedMap:
+    """Mapping split into shards, each guarded by its own lock.
+    
+    A key always lands in the same shard (``shard_index``), so callers that
+    stripe other locks by the same index serialize on the same keys. Shards
+    are built by ``factory``, e.g. a bounded LRUCache per shard.
+    """
+    
+    def __init__(self, shards: int, factory: Callable[[], MutableMapping] = dict):
+        self._shards = [(threading.Lock(), factory()) for _ in range(shards)]
+    
+    def shard_index(self, key: Hashable) -> int:
+        """Index of the shard holding ``key``."""
+        return hash(key) % len(self._shards)
+    
+    def _shard(self, key: Hashable):
+        return self._shards[self.shard_index(key)]
+    
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        lock, shard = self._shard(key)
+        with lock:
+            return shard.get(key, default)
+    
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        lock, shard = self._shard(key)
+        with lock:
+            return shard.pop(key, default)
+    
+    def __getitem__(self, key: Hashable) -> Any:
+        lock, shard = self._shard(key)
+        with lock:
+            return shard[key]
+    
+    def __setitem__(self, key: Hashable, value: Any):
+        lock, shard = self._shard(key)
+        with lock:
+            shard[key] = value
+    
+    def __delitem__(self, key: Hashable):
+        lock, shard = self._shard(key)
+        with lock:
+            del shard[key]
+    
+    def __contains__(self, key: Hashable) -> bool:
+        lock, shard = self._shard(key)
+        with lock:
+            return key in shard
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for _, shard in self._shards)
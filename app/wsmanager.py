@@ -1,6 +1,11 @@
+import asyncio
+import logging
 from typing import List
 from fastapi import WebSocket
-import json
+import orjson
+from .utils.orjson_response import orjson_default
+
+logger = logging.getLogger(__name__)
 
 class ConnectionManager:
     def __init__(self):
@@ -9,32 +14,52 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
-        print(f"=== WebSocket connected. Total connections: {len(self.active_connections)} ===")
+        logger.info("WebSocket connected. Total connections: %d", len(self.active_connections))
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
-            print(f"=== WebSocket disconnected. Total connections: {len(self.active_connections)} ===")
+            logger.info("WebSocket disconnected. Total connections: %d", len(self.active_connections))
 
     async def broadcast(self, message: dict):
         """Broadcast message to all connected WebSocket clients."""
         if not self.active_connections:
-            print("=== No active WebSocket connections to broadcast to ===")
             return
-            
-        print(f"=== Broadcasting to {len(self.active_connections)} connections ===")
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"=== WebSocket broadcast error: {e} ===")
+        
+        # Serialize once with orjson for all clients
+        await self.broadcast_bytes(orjson.dumps(message, default=orjson_default))
+
+    async def broadcast_bytes(self, data: bytes):
+        """Broadcast an already JSON-encoded message to all connected WebSocket clients.
+        
+        The payload is encoded once by the caller and decoded once here; it goes
+        out as a text frame, which is what the dashboard parses.
+        """
+        if not self.active_connections:
+            return
+        
+        await self._fan_out(data.decode())
+
+    async def _fan_out(self, text: str):
+        """Send a text frame to every client concurrently, dropping failed ones.
+        
+        A slow client only delays its own send, not the others.
+        """
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(connection.send_text(text) for connection in connections),
+            return_exceptions=True
+        )
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.debug("WebSocket broadcast error: %s", result)
                 # Remove bad connection
                 self.disconnect(connection)
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
         """Send message to a specific WebSocket client."""
         try:
-            await websocket.send_json(message)
+            await websocket.send_text(orjson.dumps(message, default=orjson_default).decode())
         except Exception as e:
-            print(f"=== WebSocket personal message error: {e} ===")
+            logger.debug("WebSocket personal message error: %s", e)
             self.disconnect(websocket)
@@ -0,0 +1,27 @@
+import os
+
+# Point the app at an in-memory SQLite database before it is imported; the
+# engine is created at import time, so setting this in a fixture is too late
+os.environ["DATABASE_URL"] = "sqlite+pysqlite:///:memory:"
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.db import engine
+from app.main import app
+
+# pysqlite defers BEGIN and commits when the outermost savepoint is released,
+# which would defeat the per-test rollback; let SQLAlchemy emit BEGIN itself
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+
+@event.listens_for(engine, "begin")
+def _emit_begin(connection):
+    connection.exec_driver_sql("BEGIN")
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client shared by the whole session; startup and shutdown run once."""
+    with TestClient(app) as test_client:
+        yield test_client
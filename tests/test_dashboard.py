@@ -1,98 +1,84 @@
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
 
-client = TestClient(app)
-
-def test_dashboard_page_loads():
-    """Test that the dashboard page loads successfully."""
+@pytest.fixture(scope="session")
+def dashboard_html(client):
+    """Fetch the dashboard once and share the HTML across tests."""
     response = client.get("/dashboard")
     assert response.status_code == 200
-    assert "AI Driver Behavior Analytics" in response.text
-    assert "driver-selector" in response.text
-    assert "speedChart" in response.text
-    assert "eventsChart" in response.text
+    return response.text
 
-def test_dashboard_has_driver_selector():
+def test_dashboard_page_loads(dashboard_html):
+    """Test that the dashboard page loads successfully."""
+    assert "AI Driver Behavior Analytics" in dashboard_html
+    assert "driver-selector" in dashboard_html
+    assert "speedChart" in dashboard_html
+    assert "eventsChart" in dashboard_html
+
+def test_dashboard_has_driver_selector(dashboard_html):
     """Test that the dashboard includes the driver selector dropdown."""
-    response = client.get("/dashboard")
-    assert "driverSelect" in response.text
-    assert "All Drivers" in response.text
+    assert "driverSelect" in dashboard_html
+    assert "All Drivers" in dashboard_html
 
-def test_dashboard_has_enhanced_ui_elements():
+def test_dashboard_has_enhanced_ui_elements(dashboard_html):
     """Test that the dashboard includes the new UI enhancements."""
-    response = client.get("/dashboard")
-    
     # Check for new UI elements
-    assert "stats-grid" in response.text
-    assert "score-container" in response.text
-    assert "event-indicators" in response.text
+    assert "stats-grid" in dashboard_html
+    assert "score-container" in dashboard_html
+    assert "event-indicators" in dashboard_html
     
     # Check for specific stat cards
-    assert "Total Events" in response.text
-    assert "Avg Speed" in response.text
-    assert "Max Speed" in response.text
-    assert "Active Drivers" in response.text
+    assert "Total Events" in dashboard_html
+    assert "Avg Speed" in dashboard_html
+    assert "Max Speed" in dashboard_html
+    assert "Active Drivers" in dashboard_html
 
-def test_dashboard_has_event_indicators():
+def test_dashboard_has_event_indicators(dashboard_html):
     """Test that the dashboard includes event indicators."""
-    response = client.get("/dashboard")
-    
     # Check for event indicators
-    assert "overspeeding-indicator" in response.text
-    assert "harsh-braking-indicator" in response.text
-    assert "sudden-acceleration-indicator" in response.text
-    assert "idling-indicator" in response.text
+    assert "overspeeding-indicator" in dashboard_html
+    assert "harsh-braking-indicator" in dashboard_html
+    assert "sudden-acceleration-indicator" in dashboard_html
+    assert "idling-indicator" in dashboard_html
 
-def test_dashboard_has_enhanced_charts():
+def test_dashboard_has_enhanced_charts(dashboard_html):
     """Test that the dashboard includes enhanced chart configurations."""
-    response = client.get("/dashboard")
-    
     # Check for enhanced chart features
-    assert "maintainAspectRatio: false" in response.text
-    assert "animation:" in response.text
-    assert "easeInOutQuart" in response.text
+    assert "maintainAspectRatio: false" in dashboard_html
+    assert "animation:" in dashboard_html
+    assert "easeInOutQuart" in dashboard_html
 
-def test_dashboard_has_modern_styling():
+def test_dashboard_has_modern_styling(dashboard_html):
     """Test that the dashboard includes modern CSS styling."""
-    response = client.get("/dashboard")
-    
     # Check for modern styling elements
-    assert "linear-gradient" in response.text
-    assert "border-radius: 12px" in response.text
-    assert "box-shadow" in response.text
-    assert "transition" in response.text
+    assert "linear-gradient" in dashboard_html
+    assert "border-radius: 12px" in dashboard_html
+    assert "box-shadow" in dashboard_html
+    assert "transition" in dashboard_html
 
-def test_dashboard_has_emoji_icons():
+def test_dashboard_has_emoji_icons(dashboard_html):
     """Test that the dashboard includes emoji icons for better UX."""
-    response = client.get("/dashboard")
-    
     # Check for emoji icons
-    assert "🚗" in response.text  # Header
-    assert "📈" in response.text  # Speed chart
-    assert "📊" in response.text  # Events chart
-    assert "🎯" in response.text  # Risk score
-    assert "▶️" in response.text  # Start button
-    assert "⏹️" in response.text  # Stop button
+    assert "🚗" in dashboard_html  # Header
+    assert "📈" in dashboard_html  # Speed chart
+    assert "📊" in dashboard_html  # Events chart
+    assert "🎯" in dashboard_html  # Risk score
+    assert "▶️" in dashboard_html  # Start button
+    assert "⏹️" in dashboard_html  # Stop button
 
-def test_dashboard_has_websocket_connection():
+def test_dashboard_has_websocket_connection(dashboard_html):
     """Test that the dashboard includes WebSocket connection logic."""
-    response = client.get("/dashboard")
-    
     # Check for WebSocket functionality
-    assert "WebSocket" in response.text
-    assert "connectWebSocket" in response.text
-    assert "onmessage" in response.text
-    assert "wsUrl" in response.text
+    assert "WebSocket" in dashboard_html
+    assert "connectWebSocket" in dashboard_html
+    assert "onmessage" in dashboard_html
+    assert "wsUrl" in dashboard_html
 
-def test_dashboard_has_driver_filtering():
+def test_dashboard_has_driver_filtering(dashboard_html):
     """Test that the dashboard includes driver filtering functionality."""
-    response = client.get("/dashboard")
-    
     # Check for driver filtering logic
-    assert "selectedDriver" in response.text
-    assert "loadDrivers" in response.text
-    assert "driverSelect" in response.text
+    assert "selectedDriver" in dashboard_html
+    assert "loadDrivers" in dashboard_html
+    assert "driverSelect" in dashboard_html
 
 if __name__ == "__main__":
     pytest.main([__file__])
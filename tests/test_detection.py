@@ -1,14 +1,23 @@
+import asyncio
 import pytest
-from datetime import datetime, timedelta
+import numpy as np
+import orjson
+from datetime import datetime, timedelta, timezone
+from app import _detect_core
 from app.detection import (
     compute_acceleration,
     detect_events,
+    detect_events_batch,
     calculate_risk_score,
     handle_point,
+    Message,
+    Telemetry,
     reset_driver_state,
-    get_driver_state
+    get_driver_state,
+    _set_counts
 )
 from app.config import (
+    config,
     OVERSPEED_KPH,
     HARSH_BRAKE_KPH_S,
     SUDDEN_ACCEL_KPH_S,
@@ -18,32 +27,27 @@ from app.config import (
 class TestAccelerationComputation:
     """Test acceleration computation function."""
     
-    def test_normal_acceleration(self):
-        """Test normal acceleration calculation."""
-        prev_ts = datetime(2020, 1, 1, 0, 0, 0)
-        now = datetime(2020, 1, 1, 0, 0, 1)
-        accel = compute_acceleration(50.0, prev_ts, 60.0, now)
-        assert accel == 10.0
+    @pytest.mark.parametrize("v0,v1,dt,expected", [
+        (50.0, 60.0, 1, 10.0),   # normal acceleration
+        (60.0, 50.0, 1, -10.0),  # deceleration
+        (50.0, 60.0, 0, 0.0),    # zero time delta
+        (50.0, 60.0, -1, 0.0),   # negative time delta
+    ], ids=["normal", "negative", "zero_delta_time", "negative_delta_time"])
+    def test_acceleration(self, v0, v1, dt, expected):
+        """Test acceleration calculation, including non-positive time deltas."""
+        prev_ts = datetime(2020, 1, 1, 0, 0, 1)
+        now = prev_ts + timedelta(seconds=dt)
+        accel = compute_acceleration(v0, prev_ts, v1, now)
+        assert accel == expected
     
-    def test_negative_acceleration(self):
-        """Test deceleration calculation."""
+    def test_matches_compiled_kernel(self):
+        """Test that the batch kernel agrees with the scalar function."""
         prev_ts = datetime(2020, 1, 1, 0, 0, 0)
-        now = datetime(2020, 1, 1, 0, 0, 1)
-        accel = compute_acceleration(60.0, prev_ts, 50.0, now)
-        assert accel == -10.0
-    
-    def test_zero_delta_time(self):
-        """Test handling of zero time delta."""
-        ts = datetime(2020, 1, 1, 0, 0, 0)
-        accel = compute_acceleration(50.0, ts, 60.0, ts)
-        assert accel == 0.0
-    
-    def test_negative_delta_time(self):
-        """Test handling of negative time delta."""
-        prev_ts = datetime(2020, 1, 1, 0, 0, 1)
-        now = datetime(2020, 1, 1, 0, 0, 0)
-        accel = compute_acceleration(50.0, prev_ts, 60.0, now)
-        assert accel == 0.0
+        for speed, seconds in [(60.0, 1.0), (40.0, 2.5), (60.0, 0.0), (60.0, -1.0)]:
+            now = prev_ts + timedelta(seconds=seconds)
+            expected = compute_acceleration(50.0, prev_ts, speed, now)
+            accel = _detect_core.acceleration_kph_s(50.0, 0, speed, int(seconds * 1e9))
+            assert accel == pytest.approx(expected)
 
 class TestEventDetection:
     """Test event detection logic."""
@@ -60,9 +64,9 @@ class TestEventDetection:
         events = detect_events("test_driver", timestamp, 0.0, 0.0, speed, 0.0)
         
         assert len(events) == 1
-        assert events[0]['event_type'] == 'overspeeding'
-        assert events[0]['speed_kph'] == speed
-        assert events[0]['meta']['threshold'] == OVERSPEED_KPH
+        assert events[0].event_type == 'overspeeding'
+        assert events[0].speed_kph == speed
+        assert events[0].meta['threshold'] == OVERSPEED_KPH
     
     def test_harsh_braking_detection(self):
         """Test harsh braking event detection."""
@@ -72,9 +76,9 @@ class TestEventDetection:
         events = detect_events("test_driver", timestamp, 0.0, 0.0, 50.0, acceleration)
         
         assert len(events) == 1
-        assert events[0]['event_type'] == 'harsh_braking'
-        assert events[0]['acceleration_kph_s'] == acceleration
-        assert events[0]['meta']['threshold'] == HARSH_BRAKE_KPH_S
+        assert events[0].event_type == 'harsh_braking'
+        assert events[0].acceleration_kph_s == acceleration
+        assert events[0].meta['threshold'] == HARSH_BRAKE_KPH_S
     
     def test_sudden_acceleration_detection(self):
         """Test sudden acceleration event detection."""
@@ -84,9 +88,9 @@ class TestEventDetection:
         events = detect_events("test_driver", timestamp, 0.0, 0.0, 50.0, acceleration)
         
         assert len(events) == 1
-        assert events[0]['event_type'] == 'sudden_acceleration'
-        assert events[0]['acceleration_kph_s'] == acceleration
-        assert events[0]['meta']['threshold'] == SUDDEN_ACCEL_KPH_S
+        assert events[0].event_type == 'sudden_acceleration'
+        assert events[0].acceleration_kph_s == acceleration
+        assert events[0].meta['threshold'] == SUDDEN_ACCEL_KPH_S
     
     def test_idling_detection(self):
         """Test idling event detection."""
@@ -100,8 +104,8 @@ class TestEventDetection:
         events2 = detect_events("test_driver", idle_time, 0.0, 0.0, 0.0, 0.0)
         
         assert len(events2) == 1
-        assert events2[0]['event_type'] == 'idling'
-        assert events2[0]['meta']['idle_duration_seconds'] >= IDLE_SECONDS_THRESHOLD
+        assert events2[0].event_type == 'idling'
+        assert events2[0].meta['idle_duration_seconds'] >= IDLE_SECONDS_THRESHOLD
     
     def test_multiple_events_same_point(self):
         """Test detection of multiple events in same telemetry point."""
@@ -112,10 +116,21 @@ class TestEventDetection:
         events = detect_events("test_driver", timestamp, 0.0, 0.0, speed, acceleration)
         
         assert len(events) == 2
-        event_types = [e['event_type'] for e in events]
+        event_types = [e.event_type for e in events]
         assert 'overspeeding' in event_types
         assert 'harsh_braking' in event_types
     
+    def test_runtime_threshold_override(self):
+        """Test that runtime threshold overrides apply to detection."""
+        timestamp = datetime(2020, 1, 1, 0, 0, 0)
+        config.update_detection_thresholds(overspeed_kph=OVERSPEED_KPH + 20)
+        try:
+            events = detect_events("test_driver", timestamp, 0.0, 0.0, OVERSPEED_KPH + 10, 0.0)
+        finally:
+            config.update_detection_thresholds(overspeed_kph=OVERSPEED_KPH)
+        
+        assert len(events) == 0
+    
     def test_no_events_normal_driving(self):
         """Test that normal driving doesn't trigger events."""
         timestamp = datetime(2020, 1, 1, 0, 0, 0)
@@ -126,6 +141,71 @@ class TestEventDetection:
         
         assert len(events) == 0
 
+class TestBatchDetection:
+    """Test vectorized batch event detection."""
+    
+    def setup_method(self):
+        """Reset driver states before each test."""
+        reset_driver_state("batch_driver")
+        reset_driver_state("point_driver")
+    
+    def test_batch_matches_point_by_point(self):
+        """Test that batch detection matches sequential detect_events calls."""
+        start = datetime(2020, 1, 1, 0, 0, 0)
+        offsets = [0, 1, 2, 3, 4, 5, 5 + IDLE_SECONDS_THRESHOLD, 6 + IDLE_SECONDS_THRESHOLD,
+                   7 + IDLE_SECONDS_THRESHOLD, 8 + 2 * IDLE_SECONDS_THRESHOLD]
+        speeds = [40.0, OVERSPEED_KPH + 10, 20.0, 0.0, 0.0, 30.0, 0.0, 0.0, 0.0, 0.0]
+        accels = [0.0, SUDDEN_ACCEL_KPH_S + 5, HARSH_BRAKE_KPH_S - 5, 0.0, 0.0, 2.0, 0.0, 0.0, 0.0, 0.0]
+        timestamps = [start + timedelta(seconds=o) for o in offsets]
+        
+        expected = []
+        for ts, speed, accel in zip(timestamps, speeds, accels):
+            expected.extend(detect_events("point_driver", ts, 1.0, 2.0, speed, accel))
+        
+        events = detect_events_batch(
+            "batch_driver",
+            np.array(timestamps, dtype='datetime64[us]'),
+            np.full(len(speeds), 1.0),
+            np.full(len(speeds), 2.0),
+            np.array(speeds),
+            np.array(accels)
+        )
+        
+        assert events == expected
+        point_state = get_driver_state("point_driver")
+        batch_state = get_driver_state("batch_driver")
+        assert batch_state == point_state
+    
+    def test_batch_derives_acceleration(self):
+        """Test that omitted accelerations are computed from the speeds."""
+        start = datetime(2020, 1, 1, 0, 0, 0)
+        speeds = [20.0, 20.0 + SUDDEN_ACCEL_KPH_S + 5, 20.0]
+        timestamps = [start + timedelta(seconds=o) for o in range(len(speeds))]
+        
+        events = detect_events_batch(
+            "batch_driver",
+            np.array(timestamps, dtype='datetime64[us]'),
+            np.full(len(speeds), 1.0),
+            np.full(len(speeds), 2.0),
+            np.array(speeds)
+        )
+        
+        event_types = [event.event_type for event in events]
+        assert event_types == ['sudden_acceleration', 'harsh_braking']
+        assert events[0].acceleration_kph_s == compute_acceleration(
+            speeds[0], timestamps[0], speeds[1], timestamps[1]
+        )
+    
+    def test_empty_batch(self):
+        """Test that an empty batch detects nothing and creates no state."""
+        empty = np.array([], dtype=float)
+        events = detect_events_batch(
+            "batch_driver", np.array([], dtype='datetime64[us]'), empty, empty, empty, empty
+        )
+        
+        assert events == []
+        assert get_driver_state("batch_driver") is None
+
 class TestRiskScoreCalculation:
     """Test risk score calculation."""
     
@@ -138,73 +218,70 @@ class TestRiskScoreCalculation:
         score = calculate_risk_score("new_driver")
         assert score == 100
     
-    def test_score_with_overspeeding(self):
-        """Test score calculation with overspeeding events."""
-        # Simulate overspeeding events
-        timestamp = datetime(2020, 1, 1, 0, 0, 0)
-        detect_events("test_driver", timestamp, 0.0, 0.0, OVERSPEED_KPH + 10, 0.0)
-        
-        score = calculate_risk_score("test_driver")
-        expected_score = 100 - (1 * 2)  # 1 overspeeding event * 2 penalty
-        assert score == expected_score
-    
-    def test_score_with_harsh_braking(self):
-        """Test score calculation with harsh braking events."""
-        # Simulate harsh braking events
-        timestamp = datetime(2020, 1, 1, 0, 0, 0)
-        detect_events("test_driver", timestamp, 0.0, 0.0, 50.0, HARSH_BRAKE_KPH_S - 5)
-        
-        score = calculate_risk_score("test_driver")
-        expected_score = 100 - (1 * 3)  # 1 harsh braking event * 3 penalty
-        assert score == expected_score
-    
-    def test_score_with_idling(self):
-        """Test score calculation with idling events."""
-        # Simulate idling event
-        start_time = datetime(2020, 1, 1, 0, 0, 0)
-        idle_time = start_time + timedelta(seconds=IDLE_SECONDS_THRESHOLD + 10)
-        detect_events("test_driver", start_time, 0.0, 0.0, 0.0, 0.0)
-        detect_events("test_driver", idle_time, 0.0, 0.0, 0.0, 0.0)
+    @pytest.mark.parametrize("counts,expected_score", [
+        ({"overspeed": 1}, 100 - (1 * 2)),  # 1 overspeeding event * 2 penalty
+        ({"harsh_brake": 1}, 100 - (1 * 3)),  # 1 harsh braking event * 3 penalty
+        ({"idle": 1}, 100 - (1 * 1)),  # 1 idling event * 1 penalty
+    ], ids=["overspeeding", "harsh_braking", "idling"])
+    def test_score_with_event(self, counts, expected_score):
+        """Test score calculation after a single event of each type."""
+        _set_counts("test_driver", **counts)
         
         score = calculate_risk_score("test_driver")
-        expected_score = 100 - (1 * 1)  # 1 idling event * 1 penalty
         assert score == expected_score
     
     def test_minimum_score(self):
         """Test that score doesn't go below 0."""
-        # Simulate many events to drive score down
-        timestamp = datetime(2020, 1, 1, 0, 0, 0)
-        for _ in range(50):  # 50 overspeeding events
-            detect_events("test_driver", timestamp, 0.0, 0.0, OVERSPEED_KPH + 10, 0.0)
+        # Many events drive the score down
+        _set_counts("test_driver", overspeed=50)  # 50 overspeeding events
         
         score = calculate_risk_score("test_driver")
         assert score == 0  # Minimum score
 
+class FakeManager:
+    """Connection manager stand-in that records broadcast messages."""
+    
+    def __init__(self):
+        self.active_connections = [object()]
+        self.messages = []
+    
+    async def broadcast_bytes(self, data: bytes):
+        self.messages.append(orjson.loads(data))
+
 class TestHandlePoint:
     """Test the main handle_point function."""
     
-    def setup_method(self):
-        """Reset driver state before each test."""
+    @pytest.fixture(autouse=True)
+    def persisted(self, monkeypatch):
+        """Reset driver state and record persistence calls instead of writing them."""
         reset_driver_state("test_driver")
+        calls = []
+        monkeypatch.setattr(
+            "app.detection._persist_events_and_scores",
+            lambda *args: calls.append(args)
+        )
+        return calls
     
     def test_handle_point_basic(self):
-        """Test basic point handling."""
+        """Test basic point handling of a dict payload with an ISO timestamp."""
         payload = {
             'driver_id': 'test_driver',
             'timestamp': '2020-01-01T00:00:00Z',
             'lat': 40.0,
             'lon': -74.0,
-            'speed_kph': 60.0
+            'speed_kph': 30.0
         }
         
-        result = handle_point(payload, None)  # manager not needed for this test
+        result = asyncio.run(handle_point(payload, None))  # manager not needed for this test
         
         assert result['driver_id'] == 'test_driver'
-        assert result['speed_kph'] == 60.0
+        assert result['timestamp'] == datetime(2020, 1, 1, tzinfo=timezone.utc)
+        assert result['speed_kph'] == 30.0
         assert result['lat'] == 40.0
         assert result['lon'] == -74.0
-        assert 'risk_score' in result
-        assert 'events' in result
+        assert result['events'] == []
+        assert result['risk_score'] == config.score_base
+        assert get_driver_state("test_driver")['last_speed_kph'] == 30.0
     
     def test_handle_point_with_event(self):
         """Test point handling that triggers an event."""
@@ -216,11 +293,93 @@ class TestHandlePoint:
             'speed_kph': OVERSPEED_KPH + 10
         }
         
-        result = handle_point(payload, None)
+        result = asyncio.run(handle_point(payload, None))
         
         assert len(result['events']) == 1
-        assert result['events'][0]['event_type'] == 'overspeeding'
+        assert result['events'][0].event_type == 'overspeeding'
         assert result['risk_score'] < 100  # Score should be reduced
+    
+    def test_handle_point_telemetry(self, persisted):
+        """Test a Telemetry payload, passing its resolved keys on to persistence."""
+        start = datetime(2020, 1, 1, 0, 0, 0)
+        asyncio.run(handle_point(Telemetry('test_driver', '7', start, 40.0, -74.0, 30.0), None))
+        point = Telemetry('test_driver', '7', start + timedelta(seconds=1), 40.0, -74.0, OVERSPEED_KPH + 10)
+        
+        result = asyncio.run(handle_point(point, None, driver_pk=3, trip_pk=9))
+        
+        assert result['acceleration_kph_s'] == OVERSPEED_KPH + 10 - 30.0
+        assert [event.event_type for event in result['events']] == ['overspeeding', 'sudden_acceleration']
+        assert len(persisted) == 1
+        driver_id, track_id, timestamp, events, state, driver_pk, trip_pk = persisted[0]
+        assert (driver_id, track_id, driver_pk, trip_pk) == ('test_driver', '7', 3, 9)
+        assert events == result['events']
+        assert state['overspeed_count'] == 1
+    
+    def test_telemetry_wire_format(self):
+        """Test that a broadcast telemetry point carries no database keys."""
+        point = Telemetry('test_driver', '7', datetime(2020, 1, 1), 40.0, -74.0, 30.0)
+        
+        message = orjson.loads(orjson.dumps(Message("telemetry", point)))
+        
+        assert message == {
+            'type': 'telemetry',
+            'payload': {
+                'driver_id': 'test_driver',
+                'track_id': '7',
+                'timestamp': '2020-01-01T00:00:00',
+                'lat': 40.0,
+                'lon': -74.0,
+                'speed_kph': 30.0
+            }
+        }
+    
+    def test_persist_without_clients_gate(self, persisted, monkeypatch):
+        """Test that events are only persisted without dashboards when configured."""
+        payload = {
+            'driver_id': 'test_driver',
+            'timestamp': '2020-01-01T00:00:00Z',
+            'lat': 40.0,
+            'lon': -74.0,
+            'speed_kph': OVERSPEED_KPH + 10
+        }
+        
+        monkeypatch.setattr(config, "persist_without_clients", False)
+        result = asyncio.run(handle_point(payload, None))
+        assert len(result['events']) == 1
+        assert persisted == []
+        
+        # A connected dashboard enables persistence again
+        asyncio.run(handle_point(dict(payload, timestamp='2020-01-01T00:00:01Z'), FakeManager()))
+        assert len(persisted) == 1
+    
+    def test_broadcast(self):
+        """Test that a processed point broadcasts its score and events."""
+        manager = FakeManager()
+        payload = {
+            'driver_id': 'test_driver',
+            'timestamp': '2020-01-01T00:00:00Z',
+            'lat': 40.0,
+            'lon': -74.0,
+            'speed_kph': OVERSPEED_KPH + 10
+        }
+        
+        result = asyncio.run(handle_point(payload, manager))
+        
+        score, event = manager.messages
+        assert score == {
+            'type': 'score',
+            'payload': {
+                'driver_id': 'test_driver',
+                'risk_score': result['risk_score'],
+                'overspeed_count': 1,
+                'harsh_brake_count': 0,
+                'sudden_accel_count': 0,
+                'idle_count': 0
+            }
+        }
+        assert event['type'] == 'event'
+        assert event['payload']['event_type'] == 'overspeeding'
+        assert event['payload']['timestamp'] == '2020-01-01T00:00:00+00:00'
 
 class TestDriverState:
     """Test driver state management."""
@@ -0,0 +1,54 @@
+import pytest
+import numpy as np
+from datetime import datetime, timedelta
+from app.simulator import calculate_distance, calculate_speed_kph, haversine_vector, track_speeds_kph
+
+class TestTrackSpeeds:
+    """Test the vectorized speed computation against the per-point one."""
+    
+    def _expected(self, lats, lons, times):
+        speeds = [0.0]
+        for i in range(1, len(lats)):
+            speeds.append(calculate_speed_kph(lats[i - 1], lons[i - 1], times[i - 1], lats[i], lons[i], times[i]))
+        return speeds
+    
+    def test_matches_calculate_speed_kph(self):
+        """Test point-for-point agreement, including zero and negative time deltas."""
+        start = datetime(2014, 9, 13, 7, 24, 32)
+        offsets = [0, 1, 3, 3, 2, 10, 11]  # A repeated and a backwards timestamp
+        times = [start + timedelta(seconds=s) for s in offsets]
+        lats = [-10.9393, -10.9394, -10.9398, -10.9399, -10.9401, -10.9420, -10.9420]
+        lons = [-37.0627, -37.0626, -37.0621, -37.0620, -37.0618, -37.0600, -37.0600]
+        
+        speeds = track_speeds_kph(
+            np.array(lats), np.array(lons), np.array(times, dtype='datetime64[ns]')
+        )
+        expected = self._expected(lats, lons, times)
+        
+        assert speeds[0] == 0.0
+        assert speeds[3] == 0.0 and speeds[4] == 0.0
+        assert speeds[-1] == 0.0  # Stationary
+        np.testing.assert_allclose(speeds, expected, rtol=1e-12, atol=1e-9)
+    
+    def test_empty_track(self):
+        """Test that an empty track has no speeds."""
+        speeds = track_speeds_kph(np.array([]), np.array([]), np.array([], dtype='datetime64[ns]'))
+        assert len(speeds) == 0
+    
+    def test_single_point(self):
+        """Test that a lone point gets zero speed."""
+        speeds = track_speeds_kph(
+            np.array([1.0]), np.array([2.0]), np.array(['2020-01-01T00:00:00'], dtype='datetime64[ns]')
+        )
+        assert speeds.tolist() == [0.0]
+    
+    @pytest.mark.parametrize("lat1,lon1,lat2,lon2", [
+        (0.0, 0.0, 0.0, 0.0),
+        (14.5995, 120.9842, 14.5996, 120.9843),
+        (51.5, -0.12, 40.7, -74.0),
+        (0.0, 0.0, 0.0, 180.0),  # Antipodal
+    ])
+    def test_haversine_vector_matches_scalar(self, lat1, lon1, lat2, lon2):
+        """Test the vectorized distance against calculate_distance."""
+        distance = haversine_vector(np.array([lat1]), np.array([lon1]), np.array([lat2]), np.array([lon2]))
+        assert distance[0] == pytest.approx(calculate_distance(lat1, lon1, lat2, lon2), rel=1e-12, abs=1e-12)
@@ -0,0 +1,61 @@
+import pytest
+from cachetools import LRUCache
+from app.utils.striped_map import StripedMap
+
+class TestStripedMap:
+    """Test the lock-striped mapping."""
+    
+    def test_get_set_pop(self):
+        """Test basic mapping operations."""
+        striped = StripedMap(4)
+        striped["a"] = 1
+        striped["b"] = 2
+        
+        assert striped["a"] == 1
+        assert striped.get("b") == 2
+        assert striped.get("missing") is None
+        assert striped.get("missing", 0) == 0
+        assert "a" in striped
+        assert "missing" not in striped
+        assert len(striped) == 2
+        
+        assert striped.pop("a") == 1
+        assert striped.pop("a", None) is None
+        del striped["b"]
+        assert len(striped) == 0
+        
+        with pytest.raises(KeyError):
+            striped["b"]
+    
+    def test_shard_index_is_stable(self):
+        """Test that a key always maps to the same shard, within range."""
+        striped = StripedMap(8)
+        for i in range(100):
+            key = f"driver_{i}"
+            index = striped.shard_index(key)
+            assert 0 <= index < 8
+            assert striped.shard_index(key) == index
+        
+        # Keys spread over more than one shard
+        assert len({striped.shard_index(f"driver_{i}") for i in range(100)}) > 1
+    
+    def test_eviction_is_per_shard(self):
+        """Test that each shard evicts its least recently used key on its own."""
+        striped = StripedMap(2, lambda: LRUCache(maxsize=2))
+        shard_keys = [[], []]
+        i = 0
+        while min(len(keys) for keys in shard_keys) < 3:
+            shard_keys[striped.shard_index(i)].append(i)
+            i += 1
+        first, second = shard_keys[0][:3], shard_keys[1][:2]
+        
+        for key in first[:2] + second:
+            striped[key] = key
+        striped.get(first[0])  # Most recently used now
+        striped[first[2]] = first[2]
+        
+        # Only the full shard evicted, and only its least recently used key
+        assert first[1] not in striped
+        assert first[0] in striped and first[2] in striped
+        assert all(key in striped for key in second)
+        assert len(striped) == 4